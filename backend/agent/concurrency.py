@@ -0,0 +1,250 @@
+"""
+上游调用的自适应并发限制
+AIMD（加性增、乘性减）调整并发上限，超出上限的调用进入有界等待队列
+属于 Agent Layer
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LLMOverloadedError(RuntimeError):
+    """上游并发已满且等待超时（或队列已满），调用被拒绝"""
+
+
+class Permit:
+    """
+    一次调用持有的并发许可
+    流式调用在收到首个片段时调用 mark_first_token，以首包延迟作为拥塞信号
+    """
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.started_at = time.monotonic()
+        self.latency: Optional[float] = None
+
+    def mark_first_token(self) -> None:
+        """记录首包延迟（只记录第一次）"""
+        if self.latency is None:
+            self.latency = time.monotonic() - self.started_at
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD 自适应并发限制器
+
+    - 成功且延迟正常：上限 += 1 / 上限（约每轮加 1）
+    - 被限流/超时，或短期延迟明显高于长期基线：上限 *= backoff_ratio（冷却期内最多一次）
+
+    非流式调用以完整耗时、流式调用以首包延迟作为延迟信号，两者量级不同，
+    按调用类型（kind）分别维护短期延迟与基线，只与同类调用比较。
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 128,
+        max_queue: int = 256,
+        max_wait: float = 15.0,
+        latency_tolerance: float = 2.0,
+        backoff_ratio: float = 0.5,
+        is_overload: Optional[Callable[[BaseException], bool]] = None,
+    ):
+        """
+        初始化限制器
+
+        Args:
+            initial_limit: 初始并发上限
+            min_limit: 并发上限下界
+            max_limit: 并发上限上界
+            max_queue: 等待队列最大长度
+            max_wait: 排队最长等待时间（秒），超时则拒绝
+            latency_tolerance: 短期延迟超过基线的倍数时视为拥塞
+            backoff_ratio: 拥塞时上限的缩减比例
+            is_overload: 判断异常是否为上游过载（429、超时等）的函数
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.is_overload = is_overload or (lambda e: False)
+
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # 调用类型 -> [短期延迟, 长期基线]
+        self._latency: Dict[str, List[float]] = {}
+        self._last_decrease = 0.0
+        self._stats = {
+            "acquired": 0,
+            "queued": 0,
+            "rejected": 0,
+            "decreases": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+        }
+
+    @property
+    def limit(self) -> int:
+        """当前并发上限（整数）"""
+        return max(int(self._limit), self.min_limit)
+
+    def has_capacity(self) -> bool:
+        """当前是否有空闲名额且无人排队（用于决定是否发起对冲请求等可选调用）"""
+        return self._in_flight < self.limit and not self._waiters
+
+    def check_admission(self) -> None:
+        """
+        在开始响应前检查是否会被立即拒绝（等待队列已满）
+
+        Raises:
+            LLMOverloadedError: 队列已满
+        """
+        if len(self._waiters) >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise LLMOverloadedError("上游调用排队已满，请稍后重试")
+
+    @asynccontextmanager
+    async def acquire(self, kind: str = "complete") -> AsyncIterator[Permit]:
+        """
+        获取一个并发许可
+
+        Args:
+            kind: 调用类型，complete（以完整耗时为延迟）或 stream（以首包延迟为延迟）
+
+        Yields:
+            Permit 对象
+
+        Raises:
+            LLMOverloadedError: 队列已满或等待超时
+        """
+        await self._acquire_slot()
+        permit = Permit(kind)
+        try:
+            yield permit
+        except Exception as e:
+            if self.is_overload(e):
+                self._on_overload()
+            raise
+        else:
+            latency = permit.latency
+            if latency is None and kind != "stream":
+                latency = time.monotonic() - permit.started_at
+            # 没有任何输出的流没有首包延迟，不参与拥塞判断
+            self._on_success(kind, latency)
+        finally:
+            self._release_slot()
+
+    async def _acquire_slot(self) -> None:
+        """占用一个并发名额，必要时排队等待"""
+        if self._in_flight < self.limit and not self._waiters:
+            self._in_flight += 1
+            self._stats["acquired"] += 1
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise LLMOverloadedError("上游调用排队已满，请稍后重试")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self._stats["queued"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait({fut}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # 名额已转交给本调用，归还
+                self._release_slot()
+            else:
+                fut.cancel()
+                self._discard_waiter(fut)
+            raise
+        finally:
+            waited = time.monotonic() - started
+            self._stats["queue_wait_total"] += waited
+            self._stats["queue_wait_max"] = max(self._stats["queue_wait_max"], waited)
+
+        if not fut.done():
+            fut.cancel()
+            self._discard_waiter(fut)
+            self._stats["rejected"] += 1
+            raise LLMOverloadedError(f"上游调用排队超过 {self.max_wait} 秒，请稍后重试")
+        self._stats["acquired"] += 1
+
+    def _discard_waiter(self, fut: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(fut)
+        except ValueError:
+            pass
+
+    def _release_slot(self) -> None:
+        """归还名额并唤醒排队者"""
+        self._in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        """在上限允许的范围内把名额直接转交给排队者"""
+        while self._waiters and self._in_flight < self.limit:
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self._in_flight += 1
+            fut.set_result(None)
+
+    def _on_success(self, kind: str, latency: Optional[float]) -> None:
+        """成功调用：更新同类调用的延迟估计，正常时加性增大上限"""
+        if latency is not None:
+            estimate = self._latency.get(kind)
+            if estimate is None:
+                estimate = self._latency[kind] = [latency, latency]
+            else:
+                estimate[0] += 0.2 * (latency - estimate[0])
+                estimate[1] += 0.02 * (latency - estimate[1])
+
+            if estimate[0] > estimate[1] * self.latency_tolerance:
+                self._decrease(f"{kind} 延迟上升", estimate[1])
+                return
+
+        self._limit = min(self._limit + 1 / self._limit, float(self.max_limit))
+        self._wake_waiters()
+
+    def _on_overload(self) -> None:
+        """上游过载信号（429、超时）"""
+        baseline = max((estimate[1] for estimate in self._latency.values()), default=0.0)
+        self._decrease("上游过载", baseline)
+
+    def _decrease(self, reason: str, baseline: float) -> None:
+        """乘性减小上限；冷却期（约一个基线延迟）内只减一次，避免同一波错误连续减半"""
+        now = time.monotonic()
+        cooldown = max(baseline, 1.0)
+        if now - self._last_decrease < cooldown:
+            return
+        self._last_decrease = now
+        old = self._limit
+        self._limit = max(self._limit * self.backoff_ratio, float(self.min_limit))
+        self._stats["decreases"] += 1
+        logger.warning("LLM 并发上限下调（%s）: %.1f -> %.1f", reason, old, self._limit)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回并发与排队指标"""
+        queued = self._stats["queued"]
+        return {
+            **self._stats,
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "queue_depth": len(self._waiters),
+            "queue_wait_avg": self._stats["queue_wait_total"] / queued if queued else 0.0,
+            "latency": {
+                kind: {"short": estimate[0], "baseline": estimate[1]}
+                for kind, estimate in self._latency.items()
+            },
+        }
@@ -0,0 +1,230 @@
+"""
+多推理端点路由
+在多个 OpenAI 兼容端点（ModelScope、自建 vLLM 等）之间按延迟与错误率选择，
+连续失败的端点被摘除，冷却后以单个探测请求尝试恢复
+属于 Agent Layer
+"""
+import json
+import logging
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 尚无延迟样本时使用的默认估计（秒）
+_DEFAULT_LATENCY = 1.0
+
+
+class Endpoint:
+    """单个推理端点的配置与健康状态"""
+
+    def __init__(
+        self,
+        name: str,
+        api_base: str,
+        api_key: str,
+        weight: float = 1.0,
+        models: Optional[Dict[str, str]] = None,
+    ):
+        """
+        初始化端点
+
+        Args:
+            name: 端点名称（用于日志和指标）
+            api_base: API 基础 URL
+            api_key: API Key
+            weight: 权重，越大分到的流量越多
+            models: 模型名映射（如自建 vLLM 上的模型名与 ModelScope 不同）
+        """
+        self.name = name
+        self.api_base = api_base
+        self.api_key = api_key
+        self.weight = max(weight, 0.01)
+        self.models = models or {}
+
+        # 调用类型 -> 延迟 EWMA；非流式为完整耗时、流式为首包延迟，量级不同，只在同类间比较
+        self.latency_ewma: Dict[str, float] = {}
+        self.error_ewma = 0.0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.eject_level = 0  # 连续摘除次数，恢复后清零，用于计算摘除时长
+        self.ejected_until: Optional[float] = None
+        self.probing = False
+        self.requests = 0
+        self.failures = 0
+
+    def model_for(self, model_name: str) -> str:
+        """返回该端点上对应的模型名"""
+        return self.models.get(model_name, model_name)
+
+    def cost(self, kind: str = "complete") -> float:
+        """路由代价：同类调用的延迟越高、在途越多、错误率越高、权重越低，代价越大"""
+        latency = self.latency_ewma.get(kind, _DEFAULT_LATENCY)
+        return latency * (1 + self.in_flight) * (1 + 10 * self.error_ewma) / self.weight
+
+    def stats(self) -> Dict[str, Any]:
+        # 不输出 api_base，避免暴露内部推理服务地址
+        return {
+            "weight": self.weight,
+            "latency_ewma": dict(self.latency_ewma),
+            "error_rate": self.error_ewma,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+            "ejected": self.ejected_until is not None,
+        }
+
+
+class EndpointRouter:
+    """
+    端点路由器
+
+    选择策略：按权重随机抽取两个健康端点，取代价较低者（power of two choices），
+    既偏向快的端点又不会把所有流量压到同一个端点上。
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+    ):
+        """
+        初始化路由器
+
+        Args:
+            endpoints: 端点列表（至少一个）
+            eject_after: 连续失败多少次后摘除
+            eject_seconds: 首次摘除时长（秒），探测失败后翻倍
+        """
+        if not endpoints:
+            raise ValueError("至少需要配置一个推理端点")
+        self.endpoints = endpoints
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+
+    def pick(self, kind: str = "complete") -> Endpoint:
+        """
+        选择一个端点并登记在途请求（调用方需在结束后调用 release）
+
+        Args:
+            kind: 调用类型，complete 或 stream（按同类调用的延迟比较端点）
+
+        Returns:
+            选中的端点
+        """
+        now = time.monotonic()
+        healthy = [ep for ep in self.endpoints if ep.ejected_until is None]
+        # 摘除期已过且没有探测在途的端点，放行一个探测请求
+        probe = next(
+            (
+                ep for ep in self.endpoints
+                if ep.ejected_until is not None and ep.ejected_until <= now and not ep.probing
+            ),
+            None,
+        )
+        if probe is not None:
+            probe.probing = True
+            logger.info("探测已摘除的端点: %s", probe.name)
+            chosen = probe
+        elif healthy:
+            if len(healthy) == 1:
+                chosen = healthy[0]
+            else:
+                weights = [ep.weight for ep in healthy]
+                a, b = random.choices(healthy, weights=weights, k=2)
+                chosen = a if a.cost(kind) <= b.cost(kind) else b
+        else:
+            # 全部被摘除时退而求其次：选最早恢复的端点
+            chosen = min(self.endpoints, key=lambda ep: ep.ejected_until)
+
+        chosen.in_flight += 1
+        chosen.requests += 1
+        return chosen
+
+    def release(self, endpoint: Endpoint) -> None:
+        """
+        结束一次请求的在途登记
+
+        探测请求被取消、因非上游原因失败或没有任何输出时不会得出结论，
+        此时解除探测标记，下一次 pick 重新探测（否则端点将永远不再被选中）。
+        """
+        endpoint.in_flight = max(endpoint.in_flight - 1, 0)
+        if endpoint.probing and endpoint.in_flight == 0:
+            endpoint.probing = False
+            logger.info("端点 %s 的探测未得出结论，等待重新探测", endpoint.name)
+
+    def record_success(self, endpoint: Endpoint, latency: float, kind: str = "complete") -> None:
+        """
+        记录成功（流式调用以首包延迟为准）
+
+        Args:
+            endpoint: 端点
+            latency: 延迟（秒）
+            kind: 调用类型，complete 或 stream
+        """
+        previous = endpoint.latency_ewma.get(kind)
+        endpoint.latency_ewma[kind] = latency if previous is None else previous + 0.2 * (latency - previous)
+        endpoint.error_ewma *= 0.8
+        endpoint.consecutive_failures = 0
+        if endpoint.ejected_until is not None:
+            logger.info("端点恢复: %s", endpoint.name)
+        endpoint.ejected_until = None
+        endpoint.eject_level = 0
+        endpoint.probing = False
+
+    def record_failure(self, endpoint: Endpoint) -> None:
+        """记录一次上游侧失败（限流、超时、5xx 等）"""
+        endpoint.failures += 1
+        endpoint.error_ewma += 0.3 * (1 - endpoint.error_ewma)
+        endpoint.consecutive_failures += 1
+
+        if endpoint.probing or (
+            endpoint.ejected_until is None and endpoint.consecutive_failures >= self.eject_after
+        ):
+            endpoint.ejections += 1
+            duration = self.eject_seconds * (2 ** min(endpoint.eject_level, 4))
+            endpoint.eject_level += 1
+            endpoint.ejected_until = time.monotonic() + duration
+            endpoint.probing = False
+            logger.warning(
+                "端点 %s 连续失败 %s 次，摘除 %.1f 秒",
+                endpoint.name, endpoint.consecutive_failures, duration,
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """返回各端点的健康与负载指标"""
+        return {ep.name: ep.stats() for ep in self.endpoints}
+
+
+def endpoints_from_settings() -> List[Endpoint]:
+    """
+    根据配置构造端点列表
+
+    LLM_ENDPOINTS 为空时退化为单个 MODELSCOPE_API_BASE 端点；
+    未填写 api_key 的端点沿用 MODELSCOPE_API_KEY。
+    """
+    configs = json.loads(settings.LLM_ENDPOINTS) if settings.LLM_ENDPOINTS else []
+    if not configs:
+        return [
+            Endpoint(
+                name="modelscope",
+                api_base=settings.MODELSCOPE_API_BASE,
+                api_key=settings.MODELSCOPE_API_KEY,
+            )
+        ]
+    return [
+        Endpoint(
+            name=config.get("name") or config["api_base"],
+            api_base=config["api_base"],
+            api_key=config.get("api_key") or settings.MODELSCOPE_API_KEY,
+            weight=float(config.get("weight", 1.0)),
+            models=config.get("models"),
+        )
+        for config in configs
+    ]
@@ -0,0 +1,198 @@
+"""
+生成参数预算
+按意图（或调用点）配置 temperature / max_tokens，
+自适应模式下根据该意图已观测到的输出长度分布收紧 max_tokens
+属于 Agent Layer
+"""
+import json
+import logging
+import math
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 非意图类调用点使用的预算键
+RECURSIVE_CALL_SITE = "recursive"
+
+# 未配置任何预算时的默认参数（与历史硬编码保持一致）
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 2000
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    上游未返回 usage 时按文本估计输出 token 数
+
+    CJK 字符大致一字一 token，其余字符（英文、代码）大致四个字符一个 token。
+    """
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uf900" <= ch <= "\uffef")
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+class GenerationParams:
+    """
+    一次调用解析出的生成参数
+
+    max_tokens 为实际下发的值（自适应模式下可能小于配置值），
+    configured_max_tokens 为配置值，用于缓存键等需要稳定取值的场合。
+    truncated 由客户端在调用结束后设置（finish_reason 为 length）。
+    """
+
+    def __init__(self, key: str, temperature: float, max_tokens: int, configured_max_tokens: int):
+        self.key = key
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.configured_max_tokens = configured_max_tokens
+        self.truncated = False
+
+    @property
+    def cacheable(self) -> bool:
+        """
+        结果能否写入以 configured_max_tokens 为键的响应缓存
+
+        被自适应上限（小于配置值）截断的回答比按配置值生成的短，不能以配置值为键缓存。
+        """
+        return not (self.truncated and self.max_tokens < self.configured_max_tokens)
+
+
+class GenerationBudget:
+    """
+    生成参数预算
+
+    profiles 的键为意图值（derivation/code/concept）或调用点名（如 recursive），
+    "default" 为兜底配置。
+    """
+
+    def __init__(
+        self,
+        profiles: Optional[Dict[str, Dict[str, Any]]] = None,
+        adaptive: bool = False,
+        percentile: float = 95.0,
+        headroom: float = 1.2,
+        min_samples: int = 30,
+        min_tokens: int = 128,
+        window: int = 500,
+    ):
+        """
+        初始化预算
+
+        Args:
+            profiles: 各意图/调用点的 temperature 与 max_tokens 配置
+            adaptive: 是否根据观测到的输出长度自适应 max_tokens
+            percentile: 自适应时参考的输出长度分位数
+            headroom: 在分位数基础上预留的余量倍数
+            min_samples: 样本数达到该值后才启用自适应
+            min_tokens: 自适应 max_tokens 的下限
+            window: 每个键保留的最近样本数
+        """
+        self.profiles = profiles or {}
+        self.adaptive = adaptive
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_samples = min_samples
+        self.min_tokens = min_tokens
+        self.window = window
+        # (键, 是否为估计值) -> 最近的输出 token 数；usage 给出的精确值与按字符估计的值分开统计
+        self._samples: Dict[Tuple[str, bool], Deque[int]] = {}
+        self._truncated: Dict[str, int] = {}
+
+    def _profile(self, key: str) -> Dict[str, Any]:
+        return self.profiles.get(key) or self.profiles.get("default") or {}
+
+    def resolve(
+        self,
+        key: Optional[str],
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> GenerationParams:
+        """
+        解析一次调用的生成参数（调用点显式传入的值优先）
+
+        Args:
+            key: 意图值或调用点名，None 时使用 default
+            temperature: 调用点覆盖的 temperature
+            max_tokens: 调用点覆盖的 max_tokens（显式指定时不做自适应）
+
+        Returns:
+            GenerationParams
+        """
+        key = key or "default"
+        profile = self._profile(key)
+        if temperature is None:
+            temperature = profile.get("temperature", DEFAULT_TEMPERATURE)
+        if max_tokens is not None:
+            return GenerationParams(key, temperature, max_tokens, max_tokens)
+
+        configured = int(profile.get("max_tokens", DEFAULT_MAX_TOKENS))
+        effective = self._adaptive_max_tokens(key, configured) if self.adaptive else configured
+        return GenerationParams(key, temperature, effective, configured)
+
+    def _window(self, key: str) -> Optional[Deque[int]]:
+        """自适应使用的样本窗口：精确样本足够时优先，否则使用估计样本"""
+        for estimated in (False, True):
+            samples = self._samples.get((key, estimated))
+            if samples and len(samples) >= self.min_samples:
+                return samples
+        return None
+
+    def _adaptive_max_tokens(self, key: str, configured: int) -> int:
+        """按观测分位数 × 余量计算 max_tokens，限制在 [min_tokens, 配置值] 内"""
+        samples = self._window(key)
+        if samples is None:
+            return configured
+        ordered = sorted(samples)
+        index = min(int(len(ordered) * self.percentile / 100), len(ordered) - 1)
+        budget = math.ceil(ordered[index] * self.headroom)
+        return max(self.min_tokens, min(budget, configured))
+
+    def observe(
+        self, params: GenerationParams, output_tokens: int, truncated: bool = False, estimated: bool = False
+    ) -> None:
+        """
+        记录一次输出长度
+
+        被 max_tokens 截断的输出按配置上限记录，使分位数回升，避免预算越收越紧。
+
+        Args:
+            params: 本次调用的生成参数
+            output_tokens: 输出 token 数
+            truncated: 是否因达到 max_tokens 而截断
+            estimated: output_tokens 是否为 estimate_tokens 的估计值（记入单独的窗口）
+        """
+        params.truncated = truncated
+        if truncated:
+            self._truncated[params.key] = self._truncated.get(params.key, 0) + 1
+            output_tokens = params.configured_max_tokens
+        samples = self._samples.setdefault((params.key, estimated), deque(maxlen=self.window))
+        samples.append(output_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回各键当前生效的 max_tokens 与样本情况"""
+        keys = set(self.profiles) | {key for key, _ in self._samples}
+        result = {}
+        for key in sorted(keys):
+            params = self.resolve(key)
+            result[key] = {
+                "temperature": params.temperature,
+                "max_tokens": params.max_tokens,
+                "configured_max_tokens": params.configured_max_tokens,
+                "samples": len(self._samples.get((key, False)) or ()),
+                "estimated_samples": len(self._samples.get((key, True)) or ()),
+                "truncated": self._truncated.get(key, 0),
+            }
+        return result
+
+
+def budget_from_settings() -> GenerationBudget:
+    """根据配置构造生成参数预算"""
+    return GenerationBudget(
+        profiles=json.loads(settings.LLM_GENERATION_PROFILES),
+        adaptive=settings.LLM_ADAPTIVE_MAX_TOKENS,
+        percentile=settings.LLM_ADAPTIVE_PERCENTILE,
+        headroom=settings.LLM_ADAPTIVE_HEADROOM,
+        min_samples=settings.LLM_ADAPTIVE_MIN_SAMPLES,
+        min_tokens=settings.LLM_ADAPTIVE_MIN_TOKENS,
+    )
@@ -3,11 +3,120 @@ ModelScope OpenAI 兼容 API 客户端
 使用 OpenAI SDK 调用 ModelScope API
 属于 Agent Layer
 """
+import asyncio
 import logging
-from openai import AsyncOpenAI
+import random
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Optional
+
+import httpx
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncOpenAI,
+    RateLimitError,
+)
+
+from backend.agent.concurrency import AdaptiveConcurrencyLimiter
+from backend.agent.endpoint_router import Endpoint, EndpointRouter
+from backend.agent.generation import GenerationBudget, GenerationParams, estimate_tokens
+from backend.agent.response_cache import ResponseCache
+from backend.agent.single_flight import SingleFlight
+from backend.agent.stream_replay import encode_recording, replay
+from backend.config import settings
 
 logger = logging.getLogger(__name__)
 
+# 进程级共享的 HTTP 客户端（连接池），由所有 ModelScopeLLMClient 引用计数共享
+_shared_http_client: Optional[httpx.AsyncClient] = None
+_shared_http_client_refs = 0
+_shared_http_client_lock = asyncio.Lock()
+
+
+def _build_timeout() -> httpx.Timeout:
+    """根据配置构造 HTTP 超时设置"""
+    return httpx.Timeout(
+        connect=settings.LLM_CONNECT_TIMEOUT,
+        read=settings.LLM_READ_TIMEOUT,
+        write=settings.LLM_CONNECT_TIMEOUT,
+        pool=settings.LLM_CONNECT_TIMEOUT,
+    )
+
+
+def acquire_shared_http_client() -> httpx.AsyncClient:
+    """
+    获取进程级共享的 HTTP 客户端，并增加引用计数
+    
+    首次调用时按 Settings 中的连接池参数创建客户端。
+    
+    Returns:
+        共享的 httpx.AsyncClient
+    """
+    global _shared_http_client, _shared_http_client_refs
+    if _shared_http_client is None or _shared_http_client.is_closed:
+        _shared_http_client = httpx.AsyncClient(
+            http2=settings.LLM_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+            ),
+            timeout=_build_timeout(),
+        )
+        _shared_http_client_refs = 0
+        logger.info(
+            "创建共享 LLM HTTP 连接池: max_connections=%s, max_keepalive=%s, http2=%s",
+            settings.LLM_HTTP_MAX_CONNECTIONS,
+            settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            settings.LLM_HTTP2,
+        )
+    _shared_http_client_refs += 1
+    return _shared_http_client
+
+
+async def release_shared_http_client() -> None:
+    """释放一次共享 HTTP 客户端引用，引用归零时关闭连接池"""
+    global _shared_http_client, _shared_http_client_refs
+    async with _shared_http_client_lock:
+        if _shared_http_client is None:
+            return
+        _shared_http_client_refs = max(_shared_http_client_refs - 1, 0)
+        if _shared_http_client_refs == 0:
+            await _shared_http_client.aclose()
+            _shared_http_client = None
+            logger.info("共享 LLM HTTP 连接池已关闭")
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """
+    判断异常是否表示上游过载（429、503 或超时）
+    
+    同时检查被包装为 RuntimeError 之前的原始异常
+    """
+    for e in (exc, exc.__cause__):
+        if isinstance(e, (RateLimitError, APITimeoutError)):
+            return True
+        if isinstance(e, APIStatusError) and e.status_code in (429, 503):
+            return True
+    return False
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """
+    判断异常是否值得重试（限流、超时、连接错误、5xx）
+    
+    同时检查被包装为 RuntimeError 之前的原始异常
+    """
+    for e in (exc, exc.__cause__):
+        if isinstance(e, (RateLimitError, APITimeoutError, APIConnectionError)):
+            return True
+        if isinstance(e, APIStatusError) and (e.status_code == 429 or e.status_code >= 500):
+            return True
+    return False
+
 
 class ModelScopeLLMClient:
     """
@@ -19,7 +128,12 @@ class ModelScopeLLMClient:
         self,
         model_name: str,
         api_key: str,
-        api_base: str
+        api_base: str,
+        cache: Optional[ResponseCache] = None,
+        single_flight: Optional[SingleFlight] = None,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        router: Optional[EndpointRouter] = None,
+        budget: Optional[GenerationBudget] = None,
     ):
         """
         初始化 LLM 客户端
@@ -28,92 +142,395 @@ class ModelScopeLLMClient:
             model_name: 模型名称（如 'Qwen/Qwen3-32B'）
             api_key: ModelScope API Key
             api_base: API 基础 URL
+            cache: 可选的响应缓存（按意图开关生效）
+            single_flight: 可选的在途请求合并器（相同请求共享一次上游生成）
+            limiter: 可选的自适应并发限制器（流式与非流式调用共享同一预算）
+            router: 可选的多端点路由器；未提供时只使用 api_base 单个端点
+            budget: 可选的生成参数预算；未提供时使用默认 temperature/max_tokens
         """
         self.model_name = model_name
-        self.client = AsyncOpenAI(
-            base_url=api_base.rstrip('/'),
-            api_key=api_key
+        self.cache = cache
+        self.single_flight = single_flight
+        self.limiter = limiter
+        self.budget = budget or GenerationBudget()
+        # 最近的首包延迟样本，用于计算对冲请求的触发时间
+        self._ttft_samples: deque = deque(maxlen=500)
+        self._stats = {"retries": 0, "hedges_started": 0, "hedges_won": 0}
+        self.router = router or EndpointRouter(
+            [Endpoint(name="default", api_base=api_base, api_key=api_key)]
+        )
+        self._http_client = acquire_shared_http_client()
+        self._closed = False
+        # 每个端点一个 OpenAI 客户端，底层共享同一个连接池
+        self._clients = {
+            endpoint.name: AsyncOpenAI(
+                base_url=endpoint.api_base.rstrip('/'),
+                api_key=endpoint.api_key,
+                http_client=self._http_client,
+                timeout=_build_timeout(),
+            )
+            for endpoint in self.router.endpoints
+        }
+        logger.info(
+            f"ModelScopeLLMClient 初始化: model={model_name}, "
+            f"endpoints={[endpoint.api_base for endpoint in self.router.endpoints]}"
         )
-        logger.info(f"ModelScopeLLMClient 初始化: model={model_name}, api_base={api_base}")
     
-    async def acomplete(self, prompt: str) -> "LLMResponse":
+    async def acomplete(
+        self,
+        prompt: str,
+        intent: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> "LLMResponse":
         """
         异步完成文本生成
         
         Args:
             prompt: 输入提示词
+            intent: 调用方意图或调用点名（决定生成参数预算和是否走响应缓存）
+            temperature: 覆盖预算中的 temperature
+            max_tokens: 覆盖预算中的 max_tokens
             
         Returns:
             LLMResponse 对象（兼容 llama-index 接口）
         """
-        try:
-            logger.info(f"调用 ModelScope API: model={self.model_name}")
-            
-            response = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {
-                        'role': 'user',
-                        'content': prompt
+        params = self.budget.resolve(intent, temperature=temperature, max_tokens=max_tokens)
+        key = ResponseCache.make_key(
+            self.model_name,
+            prompt,
+            temperature=params.temperature,
+            max_tokens=params.configured_max_tokens,
+        )
+        use_cache = self.cache is not None and self.cache.is_enabled_for(intent)
+        if use_cache:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                logger.info(f"命中响应缓存: model={self.model_name}, intent={intent}")
+                return LLMResponse(text=cached)
+
+        async def generate() -> str:
+            content = await self._complete_with_retry(prompt, params)
+            if use_cache and content and params.cacheable:
+                await self.cache.set(key, content)
+            return content
+
+        if self.single_flight is not None:
+            content = await self.single_flight.do(key, generate)
+        else:
+            content = await generate()
+        return LLMResponse(text=content)
+
+    def _retry_delay(self, attempt: int) -> float:
+        """指数退避（full jitter）：在 [0, min(上限, 基数 * 2^attempt)] 内随机"""
+        cap = min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * (2 ** attempt))
+        return random.uniform(0, cap)
+
+    async def _complete_with_retry(self, prompt: str, params: GenerationParams) -> str:
+        """非流式调用，可重试错误按抖动指数退避重试"""
+        attempt = 0
+        while True:
+            try:
+                return await self._complete_upstream(prompt, params)
+            except Exception as e:
+                if attempt >= settings.LLM_MAX_RETRIES or not is_retryable_error(e):
+                    raise
+                delay = self._retry_delay(attempt)
+                attempt += 1
+                self._stats["retries"] += 1
+                logger.warning(
+                    f"LLM 调用失败，{delay:.2f}s 后重试（第 {attempt} 次）: model={self.model_name}"
+                )
+                await asyncio.sleep(delay)
+
+    def _slot(self, kind: str = "complete"):
+        """获取上游并发许可（未配置限制器时为空上下文）"""
+        return self.limiter.acquire(kind) if self.limiter is not None else nullcontext()
+
+    async def _complete_upstream(self, prompt: str, params: GenerationParams) -> str:
+        """发起一次非流式上游调用，返回完整文本"""
+        async with self._slot():
+            endpoint = self.router.pick()
+            started = time.monotonic()
+            try:
+                logger.info(f"调用 ModelScope API: model={self.model_name}, endpoint={endpoint.name}")
+                
+                response = await self._clients[endpoint.name].chat.completions.create(
+                    model=endpoint.model_for(self.model_name),
+                    messages=[
+                        {
+                            'role': 'user',
+                            'content': prompt
+                        }
+                    ],
+                    temperature=params.temperature,
+                    max_tokens=params.max_tokens,
+                    stream=False,  # 非流式，简化处理
+                    extra_body={
+                        "enable_thinking": False  # ModelScope API 要求：非流式调用必须设置为 False
                     }
-                ],
-                temperature=0.7,
-                max_tokens=2000,
-                stream=False,  # 非流式，简化处理
-                extra_body={
-                    "enable_thinking": False  # ModelScope API 要求：非流式调用必须设置为 False
-                }
-            )
-            
-            # 提取回答内容
-            content = response.choices[0].message.content
-            logger.info(f"API 调用成功，返回长度: {len(content) if content else 0}")
-            
-            return LLMResponse(text=content or "")
-        except Exception as e:
-            logger.error(f"LLM API 调用失败: {str(e)}", exc_info=True)
-            raise RuntimeError(f"LLM API 调用失败: {str(e)}") from e
+                )
+                
+                # 提取回答内容
+                choice = response.choices[0]
+                content = choice.message.content
+                logger.info(f"API 调用成功，返回长度: {len(content) if content else 0}")
+                self.router.record_success(endpoint, time.monotonic() - started)
+                usage = getattr(response, "usage", None)
+                completion_tokens = getattr(usage, "completion_tokens", None)
+                self.budget.observe(
+                    params,
+                    completion_tokens if completion_tokens is not None else estimate_tokens(content or ""),
+                    truncated=choice.finish_reason == "length",
+                    estimated=completion_tokens is None,
+                )
+                return content or ""
+            except Exception as e:
+                if is_retryable_error(e):
+                    self.router.record_failure(endpoint)
+                logger.error(f"LLM API 调用失败: {str(e)}", exc_info=True)
+                raise RuntimeError(f"LLM API 调用失败: {str(e)}") from e
+            finally:
+                self.router.release(endpoint)
     
-    async def astream(self, prompt: str):
+    async def astream(
+        self,
+        prompt: str,
+        intent: Optional[str] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ):
         """
         异步流式生成文本
         
+        命中响应缓存时按录制的片段边界回放；相同请求在途时共享同一个上游流，
+        后加入者先收到已产生的片段。
+        
         Args:
             prompt: 输入提示词
+            intent: 调用方意图或调用点名（决定生成参数预算和是否走响应缓存）
+            temperature: 覆盖预算中的 temperature
+            max_tokens: 覆盖预算中的 max_tokens
         
         Yields:
             每次产生一小段新增文本
         """
-        logger.info(f"调用 ModelScope API（stream）: model={self.model_name}")
+        params = self.budget.resolve(intent, temperature=temperature, max_tokens=max_tokens)
+        key = ResponseCache.make_key(
+            self.model_name,
+            prompt,
+            temperature=params.temperature,
+            max_tokens=params.configured_max_tokens,
+            stream=True,
+        )
+        use_cache = self.cache is not None and self.cache.is_enabled_for(intent)
+        if use_cache:
+            recording = await self.cache.get(key)
+            if recording is not None:
+                logger.info(f"命中流式响应缓存，回放: model={self.model_name}, intent={intent}")
+                async for text in replay(recording, settings.LLM_REPLAY_DELAY_MS):
+                    yield text
+                return
+
+        def generate():
+            upstream = self._stream_with_retry(prompt, params)
+            return self._record(upstream, key, params) if use_cache else upstream
+
+        if self.single_flight is None:
+            async for text in generate():
+                yield text
+            return
+
+        async for text in self.single_flight.stream(key, generate):
+            yield text
+
+    async def _record(self, upstream, key: str, params: GenerationParams):
+        """透传上游片段，完整结束后把片段序列写入响应缓存（被自适应上限截断的不缓存）"""
+        deltas: list[str] = []
+        async for text in upstream:
+            deltas.append(text)
+            yield text
+        if deltas and params.cacheable:
+            await self.cache.set(key, encode_recording(deltas))
+
+    async def _stream_with_retry(self, prompt: str, params: GenerationParams):
+        """
+        带重试与对冲的流式调用
+        
+        只在首个片段产出之前重试；首个片段转发后出现的错误直接抛出。
+        """
+        attempt = 0
+        while True:
+            try:
+                opened = await self._open_stream(prompt, params)
+                break
+            except Exception as e:
+                if attempt >= settings.LLM_MAX_RETRIES or not is_retryable_error(e):
+                    raise
+                delay = self._retry_delay(attempt)
+                attempt += 1
+                self._stats["retries"] += 1
+                logger.warning(
+                    f"LLM 流式调用首包前失败，{delay:.2f}s 后重试（第 {attempt} 次）: "
+                    f"model={self.model_name}"
+                )
+                await asyncio.sleep(delay)
+
+        if opened is None:
+            return
+        first, stream = opened
         try:
-            stream = await self.client.chat.completions.create(
-                model=self.model_name,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=2000,
-                stream=True,
-                extra_body={
-                    "enable_thinking": False,
-                },
+            yield first
+            async for text in stream:
+                yield text
+        finally:
+            await stream.aclose()
+
+    def _hedge_delay(self) -> Optional[float]:
+        """对冲触发时间：首包延迟的指定分位数，样本不足或未启用时返回 None"""
+        if not settings.LLM_HEDGE_ENABLED or len(self._ttft_samples) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        samples = sorted(self._ttft_samples)
+        index = min(int(len(samples) * settings.LLM_HEDGE_PERCENTILE / 100), len(samples) - 1)
+        return max(samples[index], settings.LLM_HEDGE_MIN_DELAY)
+
+    async def _open_stream(self, prompt: str, params: GenerationParams):
+        """
+        打开上游流并等待首个片段
+        
+        若超过对冲时间仍无首包（且并发预算有空闲），再发起一个相同请求，
+        保留先产出片段的那个，取消另一个。
+        
+        Returns:
+            (首个片段, 剩余片段的异步迭代器)；上游无任何输出时返回 None
+        """
+        started = time.monotonic()
+        streams = {}
+
+        def launch():
+            gen = self._stream_upstream(prompt, params)
+            streams[asyncio.ensure_future(gen.__anext__())] = gen
+
+        launch()
+        primary = next(iter(streams))
+        winner = None
+        try:
+            hedge_delay = self._hedge_delay()
+            if hedge_delay is not None:
+                await asyncio.wait({primary}, timeout=hedge_delay)
+                limiter_free = self.limiter is None or self.limiter.has_capacity()
+                if not primary.done() and limiter_free:
+                    self._stats["hedges_started"] += 1
+                    logger.info(
+                        f"首包超过 {hedge_delay:.2f}s 未到达，发起对冲请求: model={self.model_name}"
+                    )
+                    launch()
+
+            pending = set(streams)
+            error: Optional[BaseException] = None
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    exc = task.exception()
+                    if exc is None or isinstance(exc, StopAsyncIteration):
+                        winner = task
+                        break
+                    error = error or exc
+
+            if winner is None:
+                raise error
+            if winner is not primary:
+                self._stats["hedges_won"] += 1
+            if winner.exception() is not None:
+                # 上游正常结束但没有任何输出
+                return None
+            self._ttft_samples.append(time.monotonic() - started)
+            return winner.result(), streams[winner]
+        finally:
+            for task, gen in streams.items():
+                if task is winner:
+                    continue
+                if not task.done():
+                    task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await gen.aclose()
+
+    async def _stream_upstream(self, prompt: str, params: GenerationParams):
+        """发起一次流式上游调用，逐段产出文本（整个流期间占用一个并发许可）"""
+        async with self._slot("stream") as permit:
+            endpoint = self.router.pick("stream")
+            started = time.monotonic()
+            first_token = True
+            # 请求在最后一个片段中附带 usage；上游不支持时按文本估计 token 数
+            output_parts: list[str] = []
+            completion_tokens = None
+            finish_reason = None
+            logger.info(
+                f"调用 ModelScope API（stream）: model={self.model_name}, endpoint={endpoint.name}"
             )
-            async for chunk in stream:
-                delta = chunk.choices[0].delta
-                text = getattr(delta, "content", None)
-                if text:
-                    yield text
-        except Exception as e:
-            logger.error(f"LLM 流式 API 调用失败: {str(e)}", exc_info=True)
-            raise RuntimeError(f"LLM API 调用失败: {str(e)}") from e
+            try:
+                stream = await self._clients[endpoint.name].chat.completions.create(
+                    model=endpoint.model_for(self.model_name),
+                    messages=[
+                        {
+                            "role": "user",
+                            "content": prompt,
+                        }
+                    ],
+                    temperature=params.temperature,
+                    max_tokens=params.max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    extra_body={
+                        "enable_thinking": False,
+                    },
+                )
+                async for chunk in stream:
+                    usage = getattr(chunk, "usage", None)
+                    if usage is not None and usage.completion_tokens is not None:
+                        completion_tokens = usage.completion_tokens
+                    if not chunk.choices:
+                        continue
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    delta = chunk.choices[0].delta
+                    text = getattr(delta, "content", None)
+                    if text:
+                        output_parts.append(text)
+                        if first_token:
+                            first_token = False
+                            self.router.record_success(endpoint, time.monotonic() - started, "stream")
+                            if permit is not None:
+                                permit.mark_first_token()
+                        yield text
+                self.budget.observe(
+                    params,
+                    completion_tokens if completion_tokens is not None else estimate_tokens("".join(output_parts)),
+                    truncated=finish_reason == "length",
+                    estimated=completion_tokens is None,
+                )
+            except Exception as e:
+                if is_retryable_error(e):
+                    self.router.record_failure(endpoint)
+                logger.error(f"LLM 流式 API 调用失败: {str(e)}", exc_info=True)
+                raise RuntimeError(f"LLM API 调用失败: {str(e)}") from e
+            finally:
+                self.router.release(endpoint)
     
+    def stats(self) -> dict:
+        """返回重试、对冲与生成预算统计"""
+        return {
+            **self._stats,
+            "ttft_samples": len(self._ttft_samples),
+            "hedge_delay": self._hedge_delay(),
+            "generation": self.budget.stats(),
+        }
+
     async def close(self):
-        """关闭客户端"""
-        # OpenAI 客户端不需要显式关闭
-        pass
+        """关闭客户端，释放对共享连接池的引用"""
+        if self._closed:
+            return
+        self._closed = True
+        await release_shared_http_client()
 
 
 class LLMResponse:
@@ -7,11 +7,18 @@ import logging
 import json
 from typing import AsyncGenerator, Optional
 
-from backend.agent.llm_client import ModelScopeLLMClient
+from backend.agent.concurrency import AdaptiveConcurrencyLimiter
+from backend.agent.endpoint_router import EndpointRouter, endpoints_from_settings
+from backend.agent.generation import RECURSIVE_CALL_SITE, budget_from_settings
+from backend.agent.llm_client import ModelScopeLLMClient, is_overload_error
+from backend.agent.response_cache import ResponseCache
+from backend.agent.semantic_cache import SemanticCache
+from backend.agent.single_flight import SingleFlight
 from backend.agent.intent_router import IntentRouter, IntentType
 from backend.agent.strategies import DerivationStrategy, CodeStrategy, ConceptStrategy
 from backend.agent.prompts.system_prompts import RECURSIVE_PROMPT
 from backend.api.schemas.response import AgentResponse
+from backend.data.dialogue_writer import DialogueWriteBehindQueue
 from backend.data.neo4j_client import neo4j_client
 from backend.config import settings
 
@@ -25,9 +32,67 @@ class AgentOrchestrator:
     负责协调意图识别、策略选择和响应生成
     """
 
-    def __init__(self):
-        """初始化编排器"""
+    def __init__(self, dialogue_writer: Optional[DialogueWriteBehindQueue] = None):
+        """
+        初始化编排器
+
+        Args:
+            dialogue_writer: 可选的对话写后队列；未提供时流式回答结束后同步写入 Neo4j
+        """
         logger.info("开始初始化 Orchestrator...")
+        self.dialogue_writer = dialogue_writer
+
+        # 响应缓存（主模型与 Coder 模型共享，键中包含模型名）
+        self.response_cache: Optional[ResponseCache] = None
+        if settings.LLM_CACHE_ENABLED:
+            logger.info("初始化响应缓存...")
+            self.response_cache = ResponseCache(
+                max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+                ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+                disk_path=settings.LLM_CACHE_DIR,
+                enabled_intents=json.loads(settings.LLM_CACHE_INTENTS),
+                disk_max_bytes=settings.LLM_CACHE_DISK_MAX_MB * 1024 * 1024,
+                disk_sweep_interval=settings.LLM_CACHE_DISK_SWEEP_INTERVAL,
+            )
+
+        # 语义答案缓存（按需加载嵌入模型，未启用时不引入向量存储依赖）
+        self.semantic_cache: Optional[SemanticCache] = None
+        if settings.SEMANTIC_CACHE_ENABLED:
+            logger.info("初始化语义缓存...")
+            from backend.data.vector_store import vector_store_manager
+
+            self.semantic_cache = SemanticCache(
+                embedder=vector_store_manager,
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                max_entries_per_intent=settings.SEMANTIC_CACHE_MAX_ENTRIES,
+            )
+
+        # 在途请求合并（两个模型共享，键中包含模型名）
+        self.single_flight: Optional[SingleFlight] = (
+            SingleFlight() if settings.LLM_SINGLE_FLIGHT_ENABLED else None
+        )
+
+        # 上游并发限制（两个模型访问同一服务，共享同一预算）
+        self.limiter: Optional[AdaptiveConcurrencyLimiter] = None
+        if settings.LLM_CONCURRENCY_ENABLED:
+            self.limiter = AdaptiveConcurrencyLimiter(
+                initial_limit=settings.LLM_CONCURRENCY_INITIAL,
+                min_limit=settings.LLM_CONCURRENCY_MIN,
+                max_limit=settings.LLM_CONCURRENCY_MAX,
+                max_queue=settings.LLM_QUEUE_MAX_SIZE,
+                max_wait=settings.LLM_QUEUE_MAX_WAIT,
+                is_overload=is_overload_error,
+            )
+
+        # 推理端点路由（两个模型共享端点健康状态）
+        self.router = EndpointRouter(
+            endpoints_from_settings(),
+            eject_after=settings.LLM_ENDPOINT_EJECT_AFTER,
+            eject_seconds=settings.LLM_ENDPOINT_EJECT_SECONDS,
+        )
+
+        # 生成参数预算（按意图/调用点配置，可自适应 max_tokens）
+        self.budget = budget_from_settings()
 
         logger.info(f"初始化主模型: {settings.MODEL_NAME}")
         # 使用 OpenAI 兼容 API
@@ -35,6 +100,11 @@ class AgentOrchestrator:
             model_name=settings.MODEL_NAME,
             api_key=settings.MODELSCOPE_API_KEY,
             api_base=settings.MODELSCOPE_API_BASE,
+            cache=self.response_cache,
+            single_flight=self.single_flight,
+            limiter=self.limiter,
+            router=self.router,
+            budget=self.budget,
         )
         logger.info("主模型初始化成功")
 
@@ -43,6 +113,11 @@ class AgentOrchestrator:
             model_name=settings.CODER_MODEL_NAME,
             api_key=settings.MODELSCOPE_API_KEY,
             api_base=settings.MODELSCOPE_API_BASE,
+            cache=self.response_cache,
+            single_flight=self.single_flight,
+            limiter=self.limiter,
+            router=self.router,
+            budget=self.budget,
         )
         logger.info("Coder 模型初始化成功")
 
@@ -55,10 +130,44 @@ class AgentOrchestrator:
         self.strategies = {
             IntentType.DERIVATION: DerivationStrategy(self.llm),
             IntentType.CODE: CodeStrategy(self.coder_llm),
-            IntentType.CONCEPT: ConceptStrategy(self.llm),
+            IntentType.CONCEPT: ConceptStrategy(self.llm, semantic_cache=self.semantic_cache),
         }
         logger.info("Orchestrator 初始化完成")
 
+    def metrics(self) -> dict:
+        """汇总编排器各组件的运行指标"""
+        metrics = {
+            "llm": {"main": self.llm.stats(), "coder": self.coder_llm.stats()},
+            "llm_endpoints": self.router.stats(),
+        }
+        if self.response_cache is not None:
+            metrics["llm_cache"] = self.response_cache.stats()
+        if self.semantic_cache is not None:
+            metrics["semantic_cache"] = self.semantic_cache.stats()
+        if self.single_flight is not None:
+            metrics["single_flight"] = self.single_flight.stats()
+        if self.limiter is not None:
+            metrics["llm_concurrency"] = self.limiter.stats()
+        if self.dialogue_writer is not None:
+            metrics["dialogue_writer"] = self.dialogue_writer.stats()
+        return metrics
+
+    def check_capacity(self) -> None:
+        """
+        流式响应开始前检查上游并发预算
+
+        Raises:
+            LLMOverloadedError: 上游调用排队已满
+        """
+        if self.limiter is not None:
+            self.limiter.check_admission()
+
+    async def close(self):
+        """关闭编排器持有的 LLM 客户端"""
+        await self.llm.close()
+        await self.coder_llm.close()
+        logger.info("Orchestrator 资源已释放")
+
     async def process_query(
         self,
         user_id: str,
@@ -79,57 +188,35 @@ class AgentOrchestrator:
         logger.info(f"选择策略: {intent.value}")
         strategy = self.strategies[intent]
 
+        # 生成对话 ID
+        conversation_id = str(uuid.uuid4())
+        logger.info(f"生成对话 ID: {conversation_id}")
+
         # 处理查询
         logger.info("调用策略处理查询...")
         context = {
             "user_id": user_id,
             "parent_id": parent_id,
+            "conversation_id": conversation_id,
         }
         response = await strategy.process(query, context)
         logger.info("策略处理完成")
 
-        # 生成对话 ID
-        conversation_id = str(uuid.uuid4())
         response.conversation_id = conversation_id
         response.parent_id = parent_id
-        logger.info(f"生成对话 ID: {conversation_id}")
 
         # 保存到 Neo4j（降级模式：失败只记录日志，不阻断返回）
         logger.info("开始保存到 Neo4j...")
         try:
-            # 创建用户节点
-            user_node_id = f"{conversation_id}_user"
-            await neo4j_client.save_dialogue_node(
-                node_id=user_node_id,
-                user_id=user_id,
-                role="user",
-                content=query,
-                intent=intent.value if intent else None,
-            )
-
-            # 创建 AI 节点
-            ai_node_id = conversation_id
-            await neo4j_client.save_dialogue_node(
-                node_id=ai_node_id,
+            await neo4j_client.save_dialogue_turn(
+                user_node_id=f"{conversation_id}_user",
+                ai_node_id=conversation_id,
                 user_id=user_id,
-                role="assistant",
-                content=response.answer,
+                query=query,
+                answer=response.answer,
                 intent=intent.value if intent else None,
+                parent_id=parent_id,
             )
-
-            # 创建用户到 AI 的关系
-            await neo4j_client.link_dialogue_nodes(
-                parent_node_id=user_node_id,
-                child_node_id=ai_node_id,
-            )
-
-            # 如果有父节点，创建父节点到用户节点的关系
-            if parent_id:
-                logger.info(f"创建父节点关系: parent_id={parent_id}")
-                await neo4j_client.link_dialogue_nodes(
-                    parent_node_id=parent_id,
-                    child_node_id=user_node_id,
-                )
             logger.info("Neo4j 保存成功")
         except Exception as e:
             # 降级：只记录错误，不中断主流程
@@ -160,14 +247,15 @@ class AgentOrchestrator:
         logger.info(f"[stream] 识别结果: {intent.value}")
 
         strategy = self.strategies[intent]
-        context = {
-            "user_id": user_id,
-            "parent_id": parent_id,
-        }
 
         # 生成对话 ID，并提前下发给前端
         conversation_id = str(uuid.uuid4())
         logger.info(f"[stream] 生成对话 ID: {conversation_id}")
+        context = {
+            "user_id": user_id,
+            "parent_id": parent_id,
+            "conversation_id": conversation_id,
+        }
 
         # 缓存完整回答，用于流结束后写入 Neo4j
         answer_parts: list[str] = []
@@ -192,46 +280,32 @@ class AgentOrchestrator:
             # 结束标记
             yield json.dumps({"type": "end"}, ensure_ascii=False) + "\n"
 
-            # 在后台保存到 Neo4j（降级模式）
-            full_answer = "".join(answer_parts)
-            logger.info("[stream] 开始保存流式回答到 Neo4j...")
-            try:
-                user_node_id = f"{conversation_id}_user"
-                await neo4j_client.save_dialogue_node(
-                    node_id=user_node_id,
-                    user_id=user_id,
-                    role="user",
-                    content=query,
-                    intent=intent.value if intent else None,
-                )
-
-                ai_node_id = conversation_id
-                await neo4j_client.save_dialogue_node(
-                    node_id=ai_node_id,
-                    user_id=user_id,
-                    role="assistant",
-                    content=full_answer,
-                    intent=intent.value if intent else None,
-                )
-
-                await neo4j_client.link_dialogue_nodes(
-                    parent_node_id=user_node_id,
-                    child_node_id=ai_node_id,
-                )
-
-                if parent_id:
-                    logger.info("[stream] 创建父节点关系: parent_id=%s", parent_id)
-                    await neo4j_client.link_dialogue_nodes(
-                        parent_node_id=parent_id,
-                        child_node_id=user_node_id,
+            # 保存到 Neo4j：优先放入写后队列，队满超时或未启用时同步写入（降级模式）
+            row = neo4j_client.dialogue_turn_row(
+                user_node_id=f"{conversation_id}_user",
+                ai_node_id=conversation_id,
+                user_id=user_id,
+                query=query,
+                answer="".join(answer_parts),
+                intent=intent.value if intent else None,
+                parent_id=parent_id,
+            )
+            if self.dialogue_writer is not None and await self.dialogue_writer.enqueue(row):
+                logger.info("[stream] 对话已放入写后队列")
+            else:
+                logger.info("[stream] 开始保存流式回答到 Neo4j...")
+                try:
+                    # 父节点可能还在写后队列中，先建占位父节点，避免父子关系丢失
+                    await neo4j_client.save_dialogue_turns(
+                        [row], create_missing_parents=self.dialogue_writer is not None
+                    )
+                    logger.info("[stream] Neo4j 保存成功")
+                except Exception as e:
+                    logger.warning(
+                        "[stream] 保存流式对话到 Neo4j 失败（已降级处理）: %s",
+                        str(e),
+                        exc_info=True,
                     )
-                logger.info("[stream] Neo4j 保存成功")
-            except Exception as e:
-                logger.warning(
-                    "[stream] 保存流式对话到 Neo4j 失败（已降级处理）: %s",
-                    str(e),
-                    exc_info=True,
-                )
 
     async def process_recursive_query(
         self,
@@ -249,7 +323,7 @@ class AgentOrchestrator:
         # 使用递归提示词
         prompt = f"{RECURSIVE_PROMPT}\n\n用户追问: {query}\n\n请针对性地回答："
 
-        response_text = await self.llm.acomplete(prompt)
+        response_text = await self.llm.acomplete(prompt, intent=RECURSIVE_CALL_SITE)
         answer = response_text.text if hasattr(response_text, "text") else str(
             response_text
         )
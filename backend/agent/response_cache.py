@@ -0,0 +1,275 @@
+"""
+LLM 响应缓存
+两级缓存：内存 LRU/TTL + 磁盘持久化，按模型、规范化提示词和采样参数作为键
+属于 Agent Layer
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    规范化提示词：统一全角/半角字符并折叠空白
+
+    Args:
+        prompt: 原始提示词
+
+    Returns:
+        规范化后的提示词
+    """
+    return " ".join(unicodedata.normalize("NFKC", prompt).split())
+
+
+class ResponseCache:
+    """
+    两级响应缓存
+
+    - 内存层：OrderedDict 实现的 LRU，每条记录带过期时间
+    - 磁盘层：按键哈希分目录存放的 JSON 文件，进程重启后仍可命中；
+      写入时按 disk_sweep_interval 在后台清理过期文件，总大小超过 disk_max_bytes 时按修改时间删除最旧的文件
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 86400,
+        disk_path: Optional[str] = None,
+        enabled_intents: Iterable[str] = (),
+        disk_max_bytes: int = 512 * 1024 * 1024,
+        disk_sweep_interval: float = 300.0,
+    ):
+        """
+        初始化响应缓存
+
+        Args:
+            max_entries: 内存层最大条目数
+            ttl_seconds: 条目存活时间（秒）
+            disk_path: 磁盘层目录，为空则只使用内存层
+            enabled_intents: 启用缓存的意图列表
+            disk_max_bytes: 磁盘层总大小上限（字节），0 表示不限制
+            disk_sweep_interval: 磁盘层清理间隔（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.disk_path = disk_path or None
+        self.enabled_intents = set(enabled_intents)
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_sweep_interval = disk_sweep_interval
+        # 首次写入时清理一次，回收上次运行遗留的文件
+        self._next_sweep = 0.0
+        self._sweep_task: Optional[asyncio.Task] = None
+        self._memory: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+            "disk_removed": 0,
+            "disk_bytes": 0,
+        }
+        if self.disk_path:
+            os.makedirs(self.disk_path, exist_ok=True)
+        logger.info(
+            "ResponseCache 初始化: max_entries=%s, ttl=%ss, disk_path=%s, intents=%s",
+            max_entries, ttl_seconds, self.disk_path, sorted(self.enabled_intents),
+        )
+
+    @staticmethod
+    def make_key(model: str, prompt: str, **params: Any) -> str:
+        """
+        生成缓存键
+
+        Args:
+            model: 模型名称
+            prompt: 提示词（会先规范化）
+            **params: 采样参数（temperature、max_tokens 等）
+
+        Returns:
+            SHA-256 十六进制摘要
+        """
+        raw = json.dumps(
+            {"model": model, "prompt": normalize_prompt(prompt), "params": params},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def is_enabled_for(self, intent: Optional[str]) -> bool:
+        """判断某个意图是否启用缓存"""
+        return intent is not None and intent in self.enabled_intents
+
+    async def get(self, key: str) -> Optional[Any]:
+        """
+        查询缓存（先内存后磁盘，磁盘命中会回填内存层）
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            缓存值，未命中返回 None
+        """
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return value
+            del self._memory[key]
+
+        if self.disk_path:
+            entry = await asyncio.to_thread(self._read_disk, key)
+            if entry is not None and entry[0] > now:
+                self._put_memory(key, entry[0], entry[1])
+                self._stats["disk_hits"] += 1
+                return entry[1]
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        """
+        写入缓存（同时写入内存层和磁盘层）
+
+        Args:
+            key: 缓存键
+            value: 可 JSON 序列化的缓存值
+        """
+        expires_at = time.time() + self.ttl_seconds
+        self._put_memory(key, expires_at, value)
+        self._stats["writes"] += 1
+        if self.disk_path:
+            try:
+                await asyncio.to_thread(self._write_disk, key, expires_at, value)
+            except OSError as e:
+                logger.warning("写入磁盘缓存失败（已降级为仅内存缓存）: %s", str(e))
+            self._maybe_sweep()
+
+    def _maybe_sweep(self) -> None:
+        """到达清理间隔且没有清理在进行时，在后台线程中清理磁盘层"""
+        now = time.monotonic()
+        if now < self._next_sweep or (self._sweep_task is not None and not self._sweep_task.done()):
+            return
+        self._next_sweep = now + self.disk_sweep_interval
+        self._sweep_task = asyncio.create_task(self._sweep())
+
+    async def _sweep(self) -> None:
+        try:
+            removed, remaining = await asyncio.to_thread(self._sweep_disk)
+        except OSError as e:
+            logger.warning("清理磁盘缓存失败: %s", str(e))
+            return
+        self._stats["disk_removed"] += removed
+        self._stats["disk_bytes"] = remaining
+        if removed:
+            logger.info("磁盘缓存清理: 删除 %s 个文件，剩余 %s 字节", removed, remaining)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率等统计信息"""
+        lookups = self._stats["memory_hits"] + self._stats["disk_hits"] + self._stats["misses"]
+        hits = lookups - self._stats["misses"]
+        return {
+            **self._stats,
+            "memory_entries": len(self._memory),
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def _put_memory(self, key: str, expires_at: float, value: Any) -> None:
+        """写入内存层并按 LRU 淘汰"""
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _disk_file(self, key: str) -> str:
+        """磁盘层文件路径（按键前两位分目录，避免单目录文件过多）"""
+        return os.path.join(self.disk_path, key[:2], f"{key}.json")
+
+    def _read_disk(self, key: str) -> Optional[Tuple[float, Any]]:
+        """读取磁盘层条目，文件不存在或损坏时返回 None"""
+        path = self._disk_file(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("读取磁盘缓存失败: %s", str(e))
+            return None
+        except ValueError as e:
+            logger.warning("磁盘缓存文件损坏，已删除: %s", str(e))
+            self._remove_file(path)
+            return None
+        if not isinstance(data, dict) or "value" not in data:
+            self._remove_file(path)
+            return None
+        if data.get("expires_at", 0) <= time.time():
+            self._remove_file(path)
+            return None
+        return data["expires_at"], data["value"]
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _sweep_disk(self) -> Tuple[int, int]:
+        """
+        清理磁盘层（在线程中运行）
+
+        条目的过期时间等于写入时间（文件修改时间）加 TTL，按修改时间判断过期，不需要解析文件；
+        残留的临时文件同样删除；之后总大小仍超过上限时从最旧的文件开始删除。
+
+        Returns:
+            (删除的文件数, 剩余总字节数)
+        """
+        now = time.time()
+        removed = 0
+        files = []
+        for directory, _, names in os.walk(self.disk_path):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                stale_tmp = name.endswith(".tmp") and stat.st_mtime + 60 <= now
+                if stale_tmp or (name.endswith(".json") and stat.st_mtime + self.ttl_seconds <= now):
+                    self._remove_file(path)
+                    removed += 1
+                elif name.endswith(".json"):
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        if self.disk_max_bytes > 0 and total > self.disk_max_bytes:
+            files.sort()
+            for _, size, path in files:
+                if total <= self.disk_max_bytes:
+                    break
+                self._remove_file(path)
+                removed += 1
+                total -= size
+        return removed, total
+
+    def _write_disk(self, key: str, expires_at: float, value: Any) -> None:
+        """原子写入磁盘层条目（先写临时文件再替换）"""
+        path = self._disk_file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": expires_at, "value": value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
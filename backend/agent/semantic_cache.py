@@ -0,0 +1,200 @@
+"""
+语义答案缓存
+使用 VectorStoreManager 的嵌入模型对问题编码，按余弦相似度复用历史回答
+属于 Agent Layer
+"""
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class Embedder(Protocol):
+    """嵌入模型协议接口（VectorStoreManager 满足该接口）"""
+    async def embed(self, text: str) -> List[float]:
+        ...
+
+
+class SemanticCacheHit:
+    """
+    语义缓存命中结果
+    包含回答、相似度和写入时记录的来源信息，便于审计
+    """
+    def __init__(
+        self,
+        answer: str,
+        score: float,
+        provenance: Dict[str, Any],
+        recording: Optional[Dict[str, Any]] = None,
+    ):
+        self.answer = answer
+        self.score = score
+        self.provenance = provenance
+        self.recording = recording
+
+
+class _IntentIndex:
+    """
+    单个意图下的向量索引
+
+    预分配 capacity 行的矩阵作为环形缓冲区，写满后覆盖最旧的条目（先进先出），
+    插入不需要复制整个矩阵。
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(capacity, 1)
+        self.vectors: Optional[np.ndarray] = None
+        self.entries: List[Optional[Dict[str, Any]]] = [None] * self.capacity
+        self.size = 0
+        self._next = 0
+
+    def add(self, vector: np.ndarray, entry: Dict[str, Any]) -> None:
+        if self.vectors is None:
+            self.vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+        self.vectors[self._next] = vector
+        self.entries[self._next] = entry
+        self._next = (self._next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def best_match(self, vector: np.ndarray) -> Optional[tuple]:
+        if self.vectors is None or not self.size:
+            return None
+        # 未写满时有效行为 [0, size)，写满后为全部行
+        scores = self.vectors[:self.size] @ vector
+        idx = int(np.argmax(scores))
+        return float(scores[idx]), self.entries[idx]
+
+
+class SemanticCache:
+    """
+    语义答案缓存
+
+    不同意图的条目相互隔离；每条记录携带来源信息（原始问题、对话 ID、用户、模型、时间）。
+    """
+
+    def __init__(
+        self,
+        embedder: Embedder,
+        threshold: float = 0.92,
+        max_entries_per_intent: int = 5000,
+    ):
+        """
+        初始化语义缓存
+
+        Args:
+            embedder: 嵌入模型（提供 async embed 方法）
+            threshold: 命中所需的最小余弦相似度
+            max_entries_per_intent: 每个意图保留的最大条目数
+        """
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries_per_intent = max_entries_per_intent
+        self._indexes: Dict[str, _IntentIndex] = {}
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+        logger.info(
+            "SemanticCache 初始化: threshold=%s, max_entries_per_intent=%s",
+            threshold, max_entries_per_intent,
+        )
+
+    async def _embed(self, text: str) -> np.ndarray:
+        """计算归一化后的嵌入向量"""
+        vector = np.asarray(await self.embedder.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def lookup(
+        self, intent: str, query: str
+    ) -> Tuple[Optional[SemanticCacheHit], Optional[np.ndarray]]:
+        """
+        查找语义相近的历史回答
+
+        Args:
+            intent: 意图（只在同一意图内查找）
+            query: 用户问题
+
+        Returns:
+            (命中结果, 问题的嵌入向量)；未命中时命中结果为 None，嵌入失败时两者均为 None。
+            未命中时把向量传给 store，避免对同一问题重复编码
+        """
+        try:
+            vector = await self._embed(query)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning("语义缓存嵌入失败（已降级为未命中）: %s", str(e))
+            return None, None
+
+        index = self._indexes.get(intent)
+        match = index.best_match(vector) if index is not None else None
+        if match is None or match[0] < self.threshold:
+            self._stats["misses"] += 1
+            return None, vector
+
+        score, entry = match
+        self._stats["hits"] += 1
+        logger.info(
+            "命中语义缓存: intent=%s, score=%.4f, provenance=%s",
+            intent, score, entry["provenance"],
+        )
+        hit = SemanticCacheHit(
+            answer=entry["answer"],
+            score=score,
+            provenance=dict(entry["provenance"]),
+            recording=entry.get("recording"),
+        )
+        return hit, vector
+
+    async def store(
+        self,
+        intent: str,
+        query: str,
+        answer: str,
+        provenance: Optional[Dict[str, Any]] = None,
+        recording: Optional[Dict[str, Any]] = None,
+        vector: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        写入一条回答
+
+        Args:
+            intent: 意图
+            query: 用户问题
+            answer: 完整回答
+            provenance: 来源信息（对话 ID、用户 ID、模型等）
+            recording: 可选的流式片段录制（见 stream_replay），命中时用于回放
+            vector: lookup 返回的问题向量，为 None 时重新编码
+        """
+        if not answer:
+            return
+        if vector is None:
+            try:
+                vector = await self._embed(query)
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.warning("语义缓存写入失败: %s", str(e))
+                return
+
+        entry = {
+            "answer": answer,
+            "recording": recording,
+            "provenance": {
+                **(provenance or {}),
+                "intent": intent,
+                "query": query,
+                "cached_at": datetime.utcnow().isoformat(),
+            },
+        }
+        index = self._indexes.get(intent)
+        if index is None:
+            index = self._indexes[intent] = _IntentIndex(self.max_entries_per_intent)
+        index.add(vector, entry)
+        self._stats["writes"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中统计与各意图条目数"""
+        return {
+            **self._stats,
+            "entries": {intent: index.size for intent, index in self._indexes.items()},
+        }
@@ -0,0 +1,158 @@
+"""
+在途请求合并（single-flight）
+相同键的并发调用共享同一次上游生成：非流式调用共享一个 Future，
+流式调用共享一个广播缓冲，后加入者先回放已产生的片段再跟随实时流
+属于 Agent Layer
+"""
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _StreamBroadcast:
+    """单个上游流的广播状态"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cond = asyncio.Condition()
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    在途请求合并器
+
+    键由调用方决定（通常为模型 + 规范化提示词 + 采样参数的摘要）。
+    """
+
+    def __init__(self):
+        """初始化合并器"""
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, _StreamBroadcast] = {}
+        self._stats = {
+            "calls": 0,
+            "calls_coalesced": 0,
+            "streams": 0,
+            "streams_coalesced": 0,
+        }
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行或加入一次非流式调用
+
+        Args:
+            key: 合并键
+            fn: 实际发起调用的协程工厂（只有首个调用者会执行）
+
+        Returns:
+            调用结果（所有等待者共享）
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self._stats["calls"] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._on_call_done(key, t))
+        else:
+            self._stats["calls_coalesced"] += 1
+            logger.info("合并在途请求: key=%s", key[:12])
+        # shield：单个等待者取消不影响其他等待者
+        return await asyncio.shield(task)
+
+    def _on_call_done(self, key: str, task: asyncio.Future) -> None:
+        """调用结束后移除登记，并消费异常避免未获取告警"""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def stream(
+        self,
+        key: str,
+        factory: Callable[[], AsyncIterator[str]],
+    ) -> AsyncIterator[str]:
+        """
+        执行或加入一次流式生成
+
+        Args:
+            key: 合并键
+            factory: 创建上游异步迭代器的工厂（只有首个调用者会执行）
+
+        Yields:
+            生成的文本片段（后加入者会先收到已产生的片段）
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self._stats["streams"] += 1
+            broadcast = _StreamBroadcast()
+            self._streams[key] = broadcast
+            broadcast.task = asyncio.create_task(self._produce(key, broadcast, factory))
+        else:
+            self._stats["streams_coalesced"] += 1
+            logger.info(
+                "合并在途流式请求: key=%s, 已产生片段=%s", key[:12], len(broadcast.chunks)
+            )
+
+        broadcast.subscribers += 1
+        position = 0
+        try:
+            while True:
+                async with broadcast.cond:
+                    await broadcast.cond.wait_for(
+                        lambda: len(broadcast.chunks) > position or broadcast.done
+                    )
+                    pending = broadcast.chunks[position:]
+                    done = broadcast.done
+                # 在锁外产出，避免慢消费者阻塞生产者
+                for chunk in pending:
+                    yield chunk
+                position += len(pending)
+                if done and position >= len(broadcast.chunks):
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+        finally:
+            broadcast.subscribers -= 1
+            if broadcast.subscribers == 0 and not broadcast.done:
+                # 所有订阅者都已离开，取消上游生成
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+                broadcast.task.cancel()
+
+    async def _produce(
+        self,
+        key: str,
+        broadcast: _StreamBroadcast,
+        factory: Callable[[], AsyncIterator[str]],
+    ) -> None:
+        """消费上游迭代器并广播给所有订阅者"""
+        try:
+            async for chunk in factory():
+                async with broadcast.cond:
+                    broadcast.chunks.append(chunk)
+                    broadcast.cond.notify_all()
+        except asyncio.CancelledError:
+            broadcast.error = RuntimeError("上游流式生成已取消")
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+            async with broadcast.cond:
+                broadcast.done = True
+                broadcast.cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回合并统计与当前在途数量"""
+        return {
+            **self._stats,
+            "in_flight_calls": len(self._calls),
+            "in_flight_streams": len(self._streams),
+        }
@@ -1,6 +1,7 @@
 """
 代码型策略
 """
+from backend.agent.intent_router import IntentType
 from backend.agent.strategies.base_strategy import BaseStrategy
 from backend.agent.prompts.system_prompts import CODE_PROMPT
 from backend.api.schemas.response import AgentResponse
@@ -38,7 +39,7 @@ class CodeStrategy(BaseStrategy):
         # 这里先返回占位响应
         prompt = f"{self.system_prompt}\n\n问题: {query}\n\n请提供代码实现："
         
-        response_text = await self.llm.acomplete(prompt)
+        response_text = await self.llm.acomplete(prompt, intent=IntentType.CODE.value)
         answer = response_text.text if hasattr(response_text, 'text') else str(response_text)
         
         return AgentResponse(
@@ -1,23 +1,43 @@
 """
 概念型策略
 """
+import logging
+from typing import Optional
+
+from backend.agent.intent_router import IntentType
+from backend.agent.semantic_cache import SemanticCache
+from backend.agent.stream_replay import encode_recording, replay
 from backend.agent.strategies.base_strategy import BaseStrategy
 from backend.agent.prompts.system_prompts import CONCEPT_PROMPT
 from backend.api.schemas.response import AgentResponse
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
 
 
 class ConceptStrategy(BaseStrategy):
     """概念型问题处理策略"""
 
-    def __init__(self, llm):
+    def __init__(self, llm, semantic_cache: Optional[SemanticCache] = None):
         """
         初始化策略
-        
+
         Args:
             llm: 大语言模型实例
+            semantic_cache: 可选的语义答案缓存，命中时直接复用历史回答
         """
         self.llm = llm
         self.system_prompt = CONCEPT_PROMPT
+        self.semantic_cache = semantic_cache
+
+    def _provenance(self, context: dict | None) -> dict:
+        """构造缓存条目的来源信息"""
+        context = context or {}
+        return {
+            "conversation_id": context.get("conversation_id"),
+            "user_id": context.get("user_id"),
+            "model": getattr(self.llm, "model_name", None),
+        }
 
     async def process(
         self,
@@ -27,12 +47,23 @@ class ConceptStrategy(BaseStrategy):
         """
         处理概念型问题（非流式）
         """
-        prompt = f"{self.system_prompt}\n\n问题: {query}\n\n请详细解释这个概念："
+        hit, vector = None, None
+        if self.semantic_cache is not None:
+            hit, vector = await self.semantic_cache.lookup(IntentType.CONCEPT.value, query)
 
-        response_text = await self.llm.acomplete(prompt)
-        answer = response_text.text if hasattr(response_text, "text") else str(
-            response_text
-        )
+        if hit is not None:
+            answer = hit.answer
+        else:
+            prompt = f"{self.system_prompt}\n\n问题: {query}\n\n请详细解释这个概念："
+
+            response_text = await self.llm.acomplete(prompt, intent=IntentType.CONCEPT.value)
+            answer = response_text.text if hasattr(response_text, "text") else str(
+                response_text
+            )
+            if self.semantic_cache is not None:
+                await self.semantic_cache.store(
+                    IntentType.CONCEPT.value, query, answer, self._provenance(context), vector=vector
+                )
 
         return AgentResponse(
             answer=answer,
@@ -49,9 +80,34 @@ class ConceptStrategy(BaseStrategy):
     ):
         """
         概念型问题流式处理
-        
+
         返回一个异步生成器，逐步产生回答文本。
         """
+        vector = None
+        if self.semantic_cache is not None:
+            hit, vector = await self.semantic_cache.lookup(IntentType.CONCEPT.value, query)
+            if hit is not None:
+                # 有录制时按原片段回放，否则整段返回
+                recording = hit.recording or encode_recording([hit.answer])
+                async for delta in replay(recording, settings.LLM_REPLAY_DELAY_MS):
+                    yield delta
+                return
+
         prompt = f"{self.system_prompt}\n\n问题: {query}\n\n请详细解释这个概念："
-        async for delta in self.llm.astream(prompt):  # type: ignore[attr-defined]
+        parts: list[str] = []
+        async for delta in self.llm.astream(  # type: ignore[attr-defined]
+            prompt, intent=IntentType.CONCEPT.value
+        ):
+            parts.append(delta)
             yield delta
+
+        # 只缓存完整生成的回答
+        if self.semantic_cache is not None:
+            await self.semantic_cache.store(
+                IntentType.CONCEPT.value,
+                query,
+                "".join(parts),
+                self._provenance(context),
+                recording=encode_recording(parts),
+                vector=vector,
+            )
@@ -0,0 +1,60 @@
+"""
+流式回答的录制与回放
+把一次完整 astream 生成的片段序列压缩为「全文 + 片段长度」，
+缓存命中时按原片段边界回放，保持前端 NDJSON delta 协议不变
+属于 Agent Layer
+"""
+import asyncio
+from typing import Any, AsyncIterator, Dict, List
+
+
+def encode_recording(deltas: List[str]) -> Dict[str, Any]:
+    """
+    将片段序列编码为紧凑录制格式
+
+    Args:
+        deltas: 按顺序产生的文本片段
+
+    Returns:
+        {"text": 全文, "lengths": 各片段长度}
+    """
+    return {"text": "".join(deltas), "lengths": [len(d) for d in deltas]}
+
+
+def decode_recording(recording: Dict[str, Any]) -> List[str]:
+    """
+    还原片段序列
+
+    Args:
+        recording: encode_recording 的输出
+
+    Returns:
+        文本片段列表
+    """
+    text = recording["text"]
+    deltas = []
+    offset = 0
+    for length in recording["lengths"]:
+        deltas.append(text[offset:offset + length])
+        offset += length
+    if offset < len(text):
+        deltas.append(text[offset:])
+    return deltas
+
+
+async def replay(recording: Dict[str, Any], delay_ms: float = 0) -> AsyncIterator[str]:
+    """
+    回放录制的片段
+
+    Args:
+        recording: 录制数据
+        delay_ms: 片段之间的间隔（毫秒），0 表示全速回放
+
+    Yields:
+        文本片段
+    """
+    delay = delay_ms / 1000
+    for delta in decode_recording(recording):
+        yield delta
+        # 全速回放时仍让出事件循环，避免长回答独占
+        await asyncio.sleep(delay)
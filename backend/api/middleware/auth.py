@@ -1,8 +1,14 @@
 """
 JWT 认证中间件
 """
+import hashlib
+import json
+import hmac
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
@@ -12,6 +18,77 @@ from backend.config import settings
 security = HTTPBearer()
 
 
+class VerifiedTokenCache:
+    """
+    已验证 token 的 LRU 缓存
+    
+    - 键为 token 的 HMAC-SHA256 摘要前 16 字节，条目保存完整摘要，命中时用 hmac.compare_digest 比较
+    - 条目保留到 token 的 exp 为止，过期后重新走完整验证（从而返回过期错误）
+    - verify_token 是同步依赖，会在线程池中并发执行，所有操作加锁
+    """
+    
+    def __init__(self, max_entries: int = 10000):
+        """
+        Args:
+            max_entries: 最多缓存的 token 数，0 表示禁用
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, Tuple[bytes, float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+    
+    @staticmethod
+    def digest(token: str) -> bytes:
+        """token 的 HMAC 摘要（以 JWT 密钥为 key，缓存内容泄露也无法反推或伪造 token）"""
+        return hmac.new(
+            settings.JWT_SECRET_KEY.encode("utf-8"), token.encode("utf-8"), hashlib.sha256
+        ).digest()
+    
+    def get(self, digest: bytes) -> Optional[Dict[str, Any]]:
+        """返回缓存的 payload 副本，未命中或已过期时返回 None"""
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(digest[:16])
+            if entry is None or not hmac.compare_digest(entry[0], digest):
+                self._stats["misses"] += 1
+                return None
+            if entry[1] <= time.time():
+                del self._entries[digest[:16]]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(digest[:16])
+            self._stats["hits"] += 1
+            return dict(entry[2])
+    
+    def set(self, digest: bytes, payload: Dict[str, Any]) -> None:
+        """缓存验证通过的 payload（没有 exp 的 token 不缓存）"""
+        exp = payload.get("exp")
+        if self.max_entries <= 0 or not isinstance(exp, (int, float)):
+            return
+        with self._lock:
+            self._entries[digest[:16]] = (digest, float(exp), dict(payload))
+            self._entries.move_to_end(digest[:16])
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率等指标"""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+
+token_cache = VerifiedTokenCache(max_entries=settings.JWT_CACHE_MAX_ENTRIES)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
     创建 JWT token
@@ -52,6 +129,10 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         HTTPException: token 无效或过期
     """
     token = credentials.credentials
+    digest = token_cache.digest(token)
+    cached = token_cache.get(digest)
+    if cached is not None:
+        return cached
     
     try:
         payload = jwt.decode(
@@ -66,6 +147,7 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
                 detail="Token 无效",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        token_cache.set(digest, payload)
         return payload
     except JWTError:
         raise HTTPException(
@@ -75,6 +157,20 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security))
         )
 
 
+def user_id_from_token(token: str) -> Optional[str]:
+    """
+    从已验证 token 缓存中取用户 ID（用于限流等不需要拒绝请求的场景）
+    
+    只查缓存、不做签名验证：限流中间件运行在事件循环上，未知或伪造的 token
+    不应在每个请求上触发一次验证。token 首次通过 verify_token 后才会命中。
+    
+    Returns:
+        用户 ID；token 不在缓存中（含无效、过期、缓存禁用）时返回 None
+    """
+    payload = token_cache.get(token_cache.digest(token))
+    return payload.get("sub") if payload is not None else None
+
+
 def get_current_user_id(token_data: dict = Depends(verify_token)) -> str:
     """
     获取当前用户 ID
@@ -86,3 +182,24 @@ def get_current_user_id(token_data: dict = Depends(verify_token)) -> str:
         用户 ID
     """
     return token_data.get("sub")
+
+
+def get_admin_user_id(user_id: str = Depends(get_current_user_id)) -> str:
+    """
+    获取当前管理员用户 ID（用于批量开通用户、运行指标等管理接口）
+    
+    Args:
+        user_id: 当前用户 ID
+        
+    Returns:
+        用户 ID
+        
+    Raises:
+        HTTPException: 当前用户不在 ADMIN_USER_IDS 中
+    """
+    if user_id not in json.loads(settings.ADMIN_USER_IDS):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="需要管理员权限"
+        )
+    return user_id
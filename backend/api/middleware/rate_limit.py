@@ -0,0 +1,238 @@
+"""
+令牌桶限流中间件
+按路由配置规则，分别以客户端 IP 和用户 ID 为键限流，超限时返回 429 与 Retry-After
+"""
+import json
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from fastapi.responses import JSONResponse
+
+from backend.api.middleware.auth import user_id_from_token
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitStore(Protocol):
+    """
+    令牌桶存储接口
+
+    默认的 InMemoryRateLimitStore 只在单个进程内生效；多 worker 共享限流状态时，
+    实现同样接口的存储（如 Redis + Lua 脚本一次性检查并扣减多个键）即可替换。
+    """
+
+    async def consume(self, buckets: List[Tuple[str, float, float]]) -> Tuple[bool, float]:
+        """
+        原子地从多个桶中各取出一个令牌：全部有令牌时才扣减，任意一个不足则都不扣减
+
+        Args:
+            buckets: (桶的键, 每秒补充的令牌数, 桶容量) 列表
+
+        Returns:
+            (是否放行, 被拒绝时距离所有桶都有令牌可用的秒数)
+        """
+        ...
+
+    def stats(self) -> Dict[str, Any]:
+        """返回存储指标"""
+        ...
+
+
+class InMemoryRateLimitStore:
+    """
+    进程内令牌桶存储
+
+    每个键只保存 [剩余令牌, 上次更新时间, 桶满时间] 三个浮点数；
+    定期清理已经补满的桶（补满的桶与不存在的桶等价，清理不影响限流结果）。
+    """
+
+    def __init__(self, sweep_interval: float = 60.0):
+        """
+        Args:
+            sweep_interval: 清理空闲键的间隔（秒）
+        """
+        self.sweep_interval = sweep_interval
+        self._buckets: Dict[str, List[float]] = {}
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._evicted = 0
+
+    async def consume(self, buckets: List[Tuple[str, float, float]]) -> Tuple[bool, float]:
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        # 先计算每个桶补充后的令牌数，全部足够时再统一扣减
+        levels = []
+        for key, rate, burst in buckets:
+            bucket = self._buckets.get(key)
+            tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+            levels.append((key, rate, burst, tokens))
+
+        allowed = all(tokens >= 1 for _, _, _, tokens in levels)
+        wait = 0.0 if allowed else max((1 - tokens) / rate for _, rate, _, tokens in levels if tokens < 1)
+        for key, rate, burst, tokens in levels:
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = [tokens, now, now + (burst - tokens) / rate]
+        return allowed, wait
+
+    def _sweep(self, now: float) -> None:
+        """删除已补满的桶"""
+        idle = [key for key, bucket in self._buckets.items() if bucket[2] <= now]
+        for key in idle:
+            del self._buckets[key]
+        self._evicted += len(idle)
+        self._next_sweep = now + self.sweep_interval
+
+    def stats(self) -> Dict[str, Any]:
+        return {"keys": len(self._buckets), "evicted": self._evicted}
+
+
+class RateLimitRule:
+    """单条限流规则"""
+
+    def __init__(
+        self,
+        path: str,
+        scope: str,
+        per_minute: float,
+        burst: Optional[float] = None,
+        methods: Optional[List[str]] = None,
+    ):
+        """
+        Args:
+            path: 路由路径，以 * 结尾时按前缀匹配
+            scope: 限流维度，ip 或 user（未登录或 token 尚未通过验证的请求按 IP 计）
+            per_minute: 每分钟补充的令牌数
+            burst: 桶容量（允许的突发请求数），默认等于 per_minute
+            methods: 限定的 HTTP 方法，None 表示全部
+        """
+        if scope not in ("ip", "user"):
+            raise ValueError(f"不支持的限流维度: {scope}")
+        self.path = path
+        self.scope = scope
+        self.rate = per_minute / 60.0
+        self.burst = float(burst if burst is not None else per_minute)
+        self.methods = {method.upper() for method in methods} if methods else None
+
+    def matches(self, method: str, path: str) -> bool:
+        if self.methods is not None and method not in self.methods:
+            return False
+        if self.path.endswith("*"):
+            return path.startswith(self.path[:-1])
+        return path == self.path
+
+
+class RateLimiter:
+    """按规则计算限流键并扣减令牌"""
+
+    def __init__(self, rules: List[RateLimitRule], store: RateLimitStore, trusted_proxy_hops: int = 0):
+        """
+        Args:
+            rules: 限流规则（一个请求可同时命中多条，任意一条超限即拒绝）
+            store: 令牌桶存储
+            trusted_proxy_hops: 应用前的可信反向代理层数；0 表示不使用 X-Forwarded-For
+        """
+        self.rules = rules
+        self.store = store
+        self.trusted_proxy_hops = trusted_proxy_hops
+        self._stats = {"allowed": 0, "limited": 0}
+
+    def _client_ip(self, scope: Dict[str, Any]) -> str:
+        """
+        客户端 IP
+
+        X-Forwarded-For 左侧的条目由客户端任意填写，只有最右侧 trusted_proxy_hops 个条目
+        是可信代理追加的，取从右数第 trusted_proxy_hops 个；条目不足时退回连接地址。
+        """
+        if self.trusted_proxy_hops > 0:
+            hops = [
+                hop.strip()
+                for name, value in scope.get("headers") or []
+                if name == b"x-forwarded-for"
+                for hop in value.decode("latin-1").split(",")
+                if hop.strip()
+            ]
+            if len(hops) >= self.trusted_proxy_hops:
+                return hops[-self.trusted_proxy_hops]
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    @staticmethod
+    def _user_id(scope: Dict[str, Any]) -> Optional[str]:
+        for name, value in scope.get("headers") or []:
+            if name == b"authorization":
+                scheme, _, token = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and token:
+                    return user_id_from_token(token.strip())
+        return None
+
+    async def check(self, scope: Dict[str, Any]) -> Optional[float]:
+        """
+        检查一个请求
+
+        Returns:
+            None 表示放行；否则为建议的 Retry-After 秒数
+        """
+        method, path = scope["method"], scope["path"]
+        matched = [(index, rule) for index, rule in enumerate(self.rules) if rule.matches(method, path)]
+        if not matched:
+            return None
+
+        ip = self._client_ip(scope)
+        user_id = self._user_id(scope) if any(rule.scope == "user" for _, rule in matched) else None
+        buckets = []
+        for index, rule in matched:
+            # 键带上规则序号，同一客户端在不同规则下各有一个桶
+            identity = f"user:{user_id}" if rule.scope == "user" and user_id else f"ip:{ip}"
+            buckets.append((f"{index}:{identity}", rule.rate, rule.burst))
+
+        # 被拒绝的请求不消耗任何桶，避免超限用户继续耗尽同一 IP 下其他用户共享的桶
+        allowed, wait = await self.store.consume(buckets)
+        if allowed:
+            self._stats["allowed"] += 1
+            return None
+        self._stats["limited"] += 1
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        """返回放行/拒绝计数与存储指标"""
+        return {**self._stats, "rules": len(self.rules), "store": self.store.stats()}
+
+
+class RateLimitMiddleware:
+    """
+    限流 ASGI 中间件
+
+    直接实现 ASGI 接口而非 BaseHTTPMiddleware，不会缓冲聊天的流式响应。
+    """
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            retry_after = await self.limiter.check(scope)
+            if retry_after is not None:
+                response = JSONResponse(
+                    status_code=429,
+                    content={"detail": "请求过于频繁，请稍后重试"},
+                    headers={"Retry-After": str(max(math.ceil(retry_after), 1))},
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+def rate_limiter_from_settings(store: Optional[RateLimitStore] = None) -> RateLimiter:
+    """根据配置构造限流器"""
+    rules = [RateLimitRule(**config) for config in json.loads(settings.RATE_LIMIT_RULES)]
+    return RateLimiter(
+        rules,
+        store or InMemoryRateLimitStore(sweep_interval=settings.RATE_LIMIT_SWEEP_INTERVAL),
+        trusted_proxy_hops=settings.RATE_LIMIT_TRUSTED_PROXY_HOPS,
+    )
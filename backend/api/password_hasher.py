@@ -0,0 +1,151 @@
+"""
+密码哈希
+bcrypt 计算放到独立的有界执行器（线程池或进程池）中，避免阻塞事件循环
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Deque, Dict, Optional
+
+from passlib.context import CryptContext
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 每个进程（进程池模式下每个子进程）各自持有一个 CryptContext
+_pwd_context: Optional[CryptContext] = None
+
+
+def _context() -> CryptContext:
+    global _pwd_context
+    if _pwd_context is None:
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+
+def _hash(password: str) -> str:
+    """在执行器中运行：生成密码哈希"""
+    return _context().hash(password)
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    """在执行器中运行：验证密码"""
+    return _context().verify(plain_password, hashed_password)
+
+
+class PasswordHasherBusyError(RuntimeError):
+    """等待哈希的请求过多，调用被拒绝"""
+
+
+class PasswordHasher:
+    """
+    有界的密码哈希执行器
+
+    同时运行的哈希数不超过 workers，排队数超过 max_pending 时直接拒绝；
+    排队时间（等待名额）和执行时间分别统计。
+    """
+
+    def __init__(self, workers: int = 4, use_processes: bool = False, max_pending: int = 256):
+        """
+        初始化执行器（执行器在首次使用时创建）
+
+        Args:
+            workers: 并发哈希数（执行器的线程/进程数）
+            use_processes: 是否使用进程池（线程池依赖 bcrypt 释放 GIL）
+            max_pending: 最多排队的哈希请求数
+        """
+        self.workers = workers
+        self.use_processes = use_processes
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self._slots = asyncio.Semaphore(workers)
+        self._pending = 0
+        self._queue_waits: Deque[float] = deque(maxlen=1000)
+        self._stats = {
+            "hashes": 0,
+            "verifies": 0,
+            "rejected": 0,
+            "started": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "run_time_total": 0.0,
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.use_processes:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+            logger.info(
+                "密码哈希执行器已创建: %s × %s",
+                "process" if self.use_processes else "thread", self.workers,
+            )
+        return self._executor
+
+    async def _run(self, fn, *args):
+        """排队等待名额后在执行器中运行"""
+        if self._pending >= self.max_pending:
+            self._stats["rejected"] += 1
+            raise PasswordHasherBusyError("认证请求过多，请稍后重试")
+
+        self._pending += 1
+        started = time.monotonic()
+        try:
+            async with self._slots:
+                waited = time.monotonic() - started
+                self._stats["started"] += 1
+                self._queue_waits.append(waited)
+                self._stats["queue_wait_total"] += waited
+                self._stats["queue_wait_max"] = max(self._stats["queue_wait_max"], waited)
+                run_started = time.monotonic()
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._get_executor(), fn, *args)
+                finally:
+                    self._stats["run_time_total"] += time.monotonic() - run_started
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        """生成密码哈希"""
+        self._stats["hashes"] += 1
+        return await self._run(_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """验证密码"""
+        self._stats["verifies"] += 1
+        return await self._run(_verify, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        """关闭执行器（在应用 lifespan 结束时调用）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """返回排队与执行指标"""
+        started = self._stats["started"]
+        waits = sorted(self._queue_waits)
+        return {
+            **self._stats,
+            "workers": self.workers,
+            "executor": "process" if self.use_processes else "thread",
+            "pending": self._pending,
+            "queue_wait_avg": self._stats["queue_wait_total"] / started if started else 0.0,
+            "queue_wait_p95": waits[min(int(len(waits) * 0.95), len(waits) - 1)] if waits else 0.0,
+            "run_time_avg": self._stats["run_time_total"] / started if started else 0.0,
+        }
+
+
+# 全局实例
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    use_processes=settings.PASSWORD_HASH_EXECUTOR == "process",
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
@@ -4,5 +4,5 @@
 
 from backend.api.routes import auth
 # from backend.api.routes import auth, chat, mindmap
-__all__ = ["auth", "chat"]
+__all__ = ["auth", "chat", "learning_path"]
 # __all__ = ["auth", "chat", "mindmap"]
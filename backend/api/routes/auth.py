@@ -1,31 +1,51 @@
 """
 认证相关路由
 """
-from fastapi import APIRouter, HTTPException, status, Depends
-from passlib.context import CryptContext
+import asyncio
+import csv
+import io
+
+from fastapi import APIRouter, HTTPException, status, Depends, File, UploadFile
+from pydantic import ValidationError
 from backend.api.schemas.request import UserCreate, UserLogin
-from backend.api.schemas.response import AuthResponse, ErrorResponse
-from backend.api.middleware.auth import create_access_token
+from backend.api.schemas.response import AuthResponse, ErrorResponse, UserProvisionResponse
+from backend.api.middleware.auth import create_access_token, get_admin_user_id
+from backend.api.password_hasher import PasswordHasherBusyError, password_hasher
+from backend.config import settings
 from backend.data.sqlite_db import (
+    UserAlreadyExistsError,
     get_db_connection,
     create_user,
+    create_users,
     get_user_by_username,
-    get_user_by_email
 )
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    """验证密码（在密码哈希执行器中计算）"""
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except PasswordHasherBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
 
 
-def get_password_hash(password: str) -> str:
-    """生成密码哈希"""
-    return pwd_context.hash(password)
+async def get_password_hash(password: str) -> str:
+    """生成密码哈希（在密码哈希执行器中计算）"""
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
 
 
 @router.post("/register", response_model=AuthResponse)
@@ -39,32 +59,24 @@ async def register(user_data: UserCreate):
     Returns:
         认证响应（包含 token）
     """
-    async with get_db_connection() as db:
-        # 检查用户名是否已存在
-        existing_user = await get_user_by_username(db, user_data.username)
-        if existing_user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="用户名已存在"
+    # 先哈希再占用写连接，避免 bcrypt 期间阻塞其他写入
+    hashed_password = await get_password_hash(user_data.password)
+    
+    async with get_db_connection(write=True) as db:
+        # 创建用户：用户名/邮箱重复由 UNIQUE 约束检测
+        try:
+            user_id = await create_user(
+                db,
+                username=user_data.username,
+                email=user_data.email,
+                hashed_password=hashed_password
             )
-        
-        # 检查邮箱是否已存在
-        existing_email = await get_user_by_email(db, user_data.email)
-        if existing_email:
+        except UserAlreadyExistsError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="邮箱已被注册"
+                detail=str(e)
             )
         
-        # 创建用户
-        hashed_password = get_password_hash(user_data.password)
-        user_id = await create_user(
-            db,
-            username=user_data.username,
-            email=user_data.email,
-            hashed_password=hashed_password
-        )
-        
         # 生成 token
         access_token = create_access_token(data={"sub": str(user_id)})
         
@@ -87,28 +99,109 @@ async def login(user_data: UserLogin):
     Returns:
         认证响应（包含 token）
     """
+    # 取到用户后立即归还读连接，避免 bcrypt 排队和计算期间占用连接池
     async with get_db_connection() as db:
         # 获取用户
         user = await get_user_by_username(db, user_data.username)
-        if not user:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="用户名或密码错误"
-            )
-        
-        # 验证密码
-        if not verify_password(user_data.password, user["hashed_password"]):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="用户名或密码错误"
-            )
-        
-        # 生成 token
-        access_token = create_access_token(data={"sub": str(user["id"])})
-        
-        return AuthResponse(
-            access_token=access_token,
-            token_type="bearer",
-            user_id=str(user["id"]),
-            username=user["username"]
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="用户名或密码错误"
+        )
+    
+    # 验证密码
+    if not await verify_password(user_data.password, user["hashed_password"]):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="用户名或密码错误"
+        )
+    
+    # 生成 token
+    access_token = create_access_token(data={"sub": str(user["id"])})
+    
+    return AuthResponse(
+        access_token=access_token,
+        token_type="bearer",
+        user_id=str(user["id"]),
+        username=user["username"]
+    )
+
+
+@router.post("/users/batch", response_model=UserProvisionResponse)
+async def provision_users(
+    file: UploadFile = File(..., description="CSV 文件，表头为 username,email,password"),
+    user_id: str = Depends(get_admin_user_id)
+):
+    """
+    批量开通用户（如按班级导入）
+    
+    仅 ADMIN_USER_IDS 中的用户可调用；密码在哈希执行器中并行计算，
+    所有用户在一个写事务中插入，冲突、不合法或因哈希执行器繁忙未能哈希的行单独报告，不影响其他行。
+    """
+    try:
+        text = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="CSV 文件必须为 UTF-8 编码"
         )
+    rows = list(csv.DictReader(io.StringIO(text)))
+    if len(rows) > settings.USER_PROVISION_MAX_ROWS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多开通 {settings.USER_PROVISION_MAX_ROWS} 个用户"
+        )
+    
+    results = []
+    valid = []
+    for index, row in enumerate(rows):
+        result = {
+            "row": index + 1,
+            "username": row.get("username"),
+            "email": row.get("email"),
+            "user_id": None,
+            "error": None,
+        }
+        results.append(result)
+        try:
+            valid.append((result, UserCreate(
+                username=(row.get("username") or "").strip(),
+                email=(row.get("email") or "").strip(),
+                password=row.get("password") or "",
+            )))
+        except ValidationError as e:
+            result["error"] = "; ".join(error["msg"] for error in e.errors())
+    
+    # 分批并行哈希，每批不超过执行器的排队上限；
+    # 执行器被其他请求占满时只让这些行失败，已哈希的行照常写入
+    hashed = []
+    chunk_size = max(password_hasher.workers * 4, 1)
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        hashes = await asyncio.gather(
+            *(password_hasher.hash(user.password) for _, user in chunk),
+            return_exceptions=True
+        )
+        for (result, user), hashed_password in zip(chunk, hashes):
+            if isinstance(hashed_password, PasswordHasherBusyError):
+                result["error"] = str(hashed_password)
+            elif isinstance(hashed_password, BaseException):
+                raise hashed_password
+            else:
+                hashed.append((result, user, hashed_password))
+    
+    async with get_db_connection(write=True) as db:
+        outcomes = await create_users(db, [
+            {"username": user.username, "email": user.email, "hashed_password": hashed_password}
+            for _, user, hashed_password in hashed
+        ])
+    for (result, _, _), outcome in zip(hashed, outcomes):
+        result["user_id"] = str(outcome["user_id"]) if outcome["user_id"] is not None else None
+        result["error"] = outcome["error"]
+    
+    created = sum(1 for result in results if result["user_id"] is not None)
+    return UserProvisionResponse(
+        created=created,
+        failed=len(results) - created,
+        results=results
+    )
@@ -2,13 +2,20 @@
 聊天相关路由
 """
 import logging
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from fastapi.responses import StreamingResponse
 
-from backend.api.schemas.request import ChatRequest
-from backend.api.schemas.response import DialogueNodeBase
+from backend.api.schemas.request import ChatRequest, NodeContentRequest
+from backend.api.schemas.response import (
+    DialogueChildrenPage,
+    DialogueNodeBase,
+    DialogueTreeNode,
+    NodeContent,
+)
 from backend.api.middleware.auth import get_current_user_id
+from backend.agent.concurrency import LLMOverloadedError
 from backend.agent.orchestrator import AgentOrchestrator
 from backend.data.neo4j_client import neo4j_client
 
@@ -19,10 +26,24 @@ logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
+def get_orchestrator(http_request: Request) -> AgentOrchestrator:
+    """
+    获取进程级共享的 Orchestrator（由应用 lifespan 创建）
+    
+    Args:
+        http_request: 当前 HTTP 请求
+        
+    Returns:
+        AgentOrchestrator 实例
+    """
+    return http_request.app.state.orchestrator
+
+
 @router.post("")
 async def chat(
     request: ChatRequest,
     user_id: str = Depends(get_current_user_id),
+    orchestrator: AgentOrchestrator = Depends(get_orchestrator),
 ):
     """
     发送聊天消息（支持普通提问和划词追问），使用 HTTP 流式返回结果。
@@ -40,10 +61,6 @@ async def chat(
     )
 
     try:
-        logger.info("初始化 Orchestrator...")
-        orchestrator = AgentOrchestrator()
-        logger.info("Orchestrator 初始化成功")
-
         # 暂时对普通提问走流式，对划词追问走非流式一次性返回
         if request.ref_fragment_id:
             logger.info("处理划词追问（非流式）...")
@@ -69,6 +86,9 @@ async def chat(
             return StreamingResponse(single_chunk(), media_type="application/json")
 
         logger.info("处理普通提问（流式）...")
+        # 响应头发出后只能在流内报告错误，排队已满时在这里直接返回 503；
+        # 开始后才发生的排队超时仍以 {"type":"error"} 行返回
+        orchestrator.check_capacity()
         token_stream = orchestrator.process_query_stream(
             user_id=user_id,
             query=request.query,
@@ -79,6 +99,13 @@ async def chat(
         return StreamingResponse(token_stream, media_type="application/json")
     except HTTPException:
         raise
+    except LLMOverloadedError as e:
+        logger.warning("上游繁忙，拒绝请求: %s", str(e))
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "5"},
+        )
     except Exception as e:
         logger.error("处理请求时出错: %s", str(e), exc_info=True)
         raise HTTPException(
@@ -142,3 +169,106 @@ async def get_conversation(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"查询对话树失败: {str(e)}"
         )
+
+
+@router.get("/conversation/{conversation_id}/tree", response_model=DialogueTreeNode)
+async def get_conversation_tree(
+    conversation_id: str,
+    depth: int = Query(2, ge=0, le=20, description="展开的层数"),
+    page_size: int = Query(20, ge=1, le=200, description="每个节点最多返回的子节点数"),
+    preview_chars: int = Query(200, ge=0, description="content 预览长度，0 表示返回完整内容"),
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    分页获取对话树（懒加载）
+    
+    只展开 depth 层，每个节点最多返回 page_size 个子节点。
+    节点的 children 数量小于 child_count 时，通过 /chat/nodes/{node_id}/children 继续加载：
+    next_cursor 不为空时带上它取下一页；为空时不带 cursor 从第一页开始
+    （第 depth 层的节点只返回 child_count，子节点尚未加载，next_cursor 也为空）。
+    """
+    try:
+        tree = await neo4j_client.get_dialogue_tree_page(
+            root_node_id=conversation_id,
+            user_id=user_id,
+            depth=depth,
+            page_size=page_size,
+            preview_chars=preview_chars
+        )
+    except Exception as e:
+        logger.error("分页查询对话树失败: %s", str(e), exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查询对话树失败: {str(e)}"
+        )
+    
+    if not tree:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="对话不存在"
+        )
+    return tree
+
+
+@router.get("/nodes/{node_id}/children", response_model=DialogueChildrenPage)
+async def get_node_children(
+    node_id: str,
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    depth: int = Query(1, ge=1, le=20, description="展开的层数"),
+    page_size: int = Query(20, ge=1, le=200, description="每个节点最多返回的子节点数"),
+    preview_chars: int = Query(200, ge=0, description="content 预览长度，0 表示返回完整内容"),
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    获取某节点的一页子节点
+    """
+    try:
+        page = await neo4j_client.get_dialogue_children_page(
+            parent_node_id=node_id,
+            user_id=user_id,
+            cursor=cursor,
+            page_size=page_size,
+            depth=depth,
+            preview_chars=preview_chars
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error("查询子节点失败: %s", str(e), exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查询子节点失败: {str(e)}"
+        )
+    
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="节点不存在"
+        )
+    return page
+
+
+@router.post("/nodes/content", response_model=List[NodeContent])
+async def get_node_contents(
+    request: NodeContentRequest,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    批量获取节点完整内容（配合树接口的 content 预览使用）
+    
+    不存在或不属于当前用户的节点不会出现在结果中。
+    """
+    try:
+        return await neo4j_client.get_dialogue_contents(
+            node_ids=list(dict.fromkeys(request.node_ids)),
+            user_id=user_id
+        )
+    except Exception as e:
+        logger.error("批量查询节点内容失败: %s", str(e), exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查询节点内容失败: {str(e)}"
+        )
@@ -0,0 +1,80 @@
+"""
+学习路径相关路由
+"""
+import logging
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+
+from backend.api.schemas.request import LearningPathRequest
+from backend.api.schemas.response import LearningPath
+from backend.api.middleware.auth import get_current_user_id
+from backend.data.learning_path import LearningPathService
+
+logger = logging.getLogger(__name__)
+
+
+router = APIRouter(prefix="/learning-path", tags=["learning-path"])
+
+
+def get_learning_path_service(http_request: Request) -> LearningPathService:
+    """
+    获取进程级共享的学习路径服务（由应用 lifespan 创建）
+
+    Args:
+        http_request: 当前 HTTP 请求
+
+    Returns:
+        LearningPathService 实例
+    """
+    return http_request.app.state.learning_paths
+
+
+@router.post("", response_model=List[LearningPath])
+async def get_learning_paths(
+    request: LearningPathRequest,
+    user_id: str = Depends(get_current_user_id),
+    service: LearningPathService = Depends(get_learning_path_service),
+):
+    """
+    批量查询学习路径
+
+    每个目标返回最短路径、备选路径以及按依赖顺序排列的全部前置概念。
+    """
+    try:
+        results = await service.get_paths(request.targets, alternatives=request.alternatives)
+    except Exception as e:
+        logger.error("查询学习路径失败: %s", str(e), exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查询学习路径失败: {str(e)}"
+        )
+    return [LearningPath(target=target, **result) for target, result in results.items()]
+
+
+@router.get("/{concept_name}", response_model=LearningPath)
+async def get_learning_path(
+    concept_name: str,
+    alternatives: int = Query(2, ge=0, le=10, description="除最短路径外最多返回的备选路径数"),
+    user_id: str = Depends(get_current_user_id),
+    service: LearningPathService = Depends(get_learning_path_service),
+):
+    """
+    查询单个概念的学习路径
+    """
+    try:
+        results = await service.get_paths([concept_name], alternatives=alternatives)
+    except Exception as e:
+        logger.error("查询学习路径失败: %s", str(e), exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"查询学习路径失败: {str(e)}"
+        )
+
+    result = results[concept_name]
+    if not result["found"]:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="概念不存在"
+        )
+    return LearningPath(target=concept_name, **result)
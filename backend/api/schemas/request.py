@@ -1,7 +1,7 @@
 """
 API 请求模型定义
 """
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field, EmailStr
 
 
@@ -24,3 +24,14 @@ class ChatRequest(BaseModel):
     parent_id: Optional[str] = Field(None, description="当前所在节点的 ID，首次提问可为空")
     ref_fragment_id: Optional[str] = Field(None, description="如果是划词追问，需带上片段 ID")
     session_id: str = Field(..., description="会话 ID，区分不同学习主题")
+
+
+class NodeContentRequest(BaseModel):
+    """批量获取节点完整内容"""
+    node_ids: List[str] = Field(..., min_length=1, max_length=200, description="节点 ID 列表")
+
+
+class LearningPathRequest(BaseModel):
+    """批量查询学习路径"""
+    targets: List[str] = Field(..., min_length=1, max_length=100, description="目标概念名列表")
+    alternatives: int = Field(2, ge=0, le=10, description="除最短路径外最多返回的备选路径数")
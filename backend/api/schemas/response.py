@@ -47,6 +47,22 @@ class AuthResponse(BaseModel):
     username: str
 
 
+class UserProvisionResult(BaseModel):
+    """批量开通用户时单行的结果"""
+    row: int = Field(..., description="CSV 数据行号（从 1 开始）")
+    username: Optional[str] = None
+    email: Optional[str] = None
+    user_id: Optional[str] = Field(None, description="创建成功时的用户 ID")
+    error: Optional[str] = Field(None, description="失败原因")
+
+
+class UserProvisionResponse(BaseModel):
+    """批量开通用户响应"""
+    created: int
+    failed: int
+    results: List[UserProvisionResult] = Field(default_factory=list)
+
+
 class DialogueNodeBase(BaseModel):
     """对话节点模型：树状结构的基础"""
     node_id: str = Field(..., description="全局唯一ID")
@@ -67,6 +83,48 @@ class DialogueNodeBase(BaseModel):
 ConversationNode = DialogueNodeBase
 
 
+class DialogueTreeNode(BaseModel):
+    """分页对话树节点：子节点按页返回，content 可能只是预览"""
+    node_id: str = Field(..., description="全局唯一ID")
+    user_id: str = Field(..., description="所属用户ID")
+    role: str = Field(..., description="角色: 'user' 或 'assistant'")
+    content: str = Field(..., description="Markdown 文本（content_truncated 为 true 时只是预览）")
+    content_truncated: bool = Field(False, description="content 是否被截断，完整内容通过 /chat/nodes/content 获取")
+    content_length: int = Field(0, description="完整内容的字符数")
+    intent: Optional[str] = Field(None, description="意图识别: 'derivation', 'code', 'concept'")
+    mastery_score: Optional[float] = Field(0.0, description="掌握度评分 (0-1)")
+    timestamp: Optional[datetime] = None
+    child_count: int = Field(0, description="子节点总数")
+    next_cursor: Optional[str] = Field(
+        None,
+        description="已加载一页且还有未返回的子节点时，用于加载下一页的游标；"
+                    "children 少于 child_count 而游标为空时（未展开的边界节点），不带游标从第一页加载"
+    )
+    children: List['DialogueTreeNode'] = Field(default_factory=list, description="已加载的子节点")
+
+
+class DialogueChildrenPage(BaseModel):
+    """某节点的一页子节点"""
+    parent_id: str
+    children: List[DialogueTreeNode] = Field(default_factory=list)
+    next_cursor: Optional[str] = Field(None, description="下一页游标，为空表示已加载完")
+
+
+class NodeContent(BaseModel):
+    """节点完整内容"""
+    node_id: str
+    content: str
+
+
+class LearningPath(BaseModel):
+    """单个目标概念的学习路径"""
+    target: str
+    found: bool = Field(..., description="目标概念是否存在")
+    path: List[str] = Field(default_factory=list, description="最短学习路径，从基础概念到目标")
+    alternatives: List[List[str]] = Field(default_factory=list, description="从其他基础概念出发的备选路径，按长度排序")
+    prerequisites: List[str] = Field(default_factory=list, description="全部前置概念，被依赖的在前")
+
+
 class ErrorResponse(BaseModel):
     """错误响应"""
     status: str = "error"
@@ -13,22 +13,130 @@ class Settings(BaseSettings):
     MODELSCOPE_API_KEY: str
     MODELSCOPE_API_BASE: str = "https://api.modelscope.cn/v1"
     
+    # 多推理端点（JSON 字符串格式），为空时只使用 MODELSCOPE_API_BASE
+    # 例: [{"name":"modelscope","api_base":"https://api.modelscope.cn/v1","weight":3},
+    #      {"name":"vllm","api_base":"http://vllm:8000/v1","api_key":"EMPTY","weight":1,
+    #       "models":{"qwen2.5-72b-instruct":"Qwen2.5-72B-Instruct"}}]
+    LLM_ENDPOINTS: str = "[]"
+    LLM_ENDPOINT_EJECT_AFTER: int = 3  # 连续失败多少次后摘除端点
+    LLM_ENDPOINT_EJECT_SECONDS: float = 30.0  # 首次摘除时长（秒），探测失败后翻倍
+    
     # 模型选择
     MODEL_NAME: str = "qwen2.5-72b-instruct"
     CODER_MODEL_NAME: str = "qwen2.5-coder-7b-instruct"
     
+    # LLM HTTP 连接池配置（主模型与 Coder 模型共享）
+    LLM_HTTP_MAX_CONNECTIONS: int = 200
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 60.0  # 秒
+    LLM_HTTP2: bool = True
+    LLM_CONNECT_TIMEOUT: float = 10.0  # 秒
+    LLM_READ_TIMEOUT: float = 120.0  # 秒
+    LLM_SINGLE_FLIGHT_ENABLED: bool = True  # 合并相同的在途请求
+    
+    # LLM 上游自适应并发限制（AIMD）
+    LLM_CONCURRENCY_ENABLED: bool = True
+    LLM_CONCURRENCY_INITIAL: int = 16
+    LLM_CONCURRENCY_MIN: int = 2
+    LLM_CONCURRENCY_MAX: int = 128
+    LLM_QUEUE_MAX_SIZE: int = 256  # 等待队列最大长度
+    LLM_QUEUE_MAX_WAIT: float = 15.0  # 排队最长等待（秒），超时拒绝
+    
+    # LLM 重试与对冲请求
+    LLM_MAX_RETRIES: int = 2  # 仅在首个片段转发前重试
+    LLM_RETRY_BASE_DELAY: float = 0.5  # 秒
+    LLM_RETRY_MAX_DELAY: float = 8.0  # 秒
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0  # 首包延迟超过该分位数时发起对冲
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # 样本不足时不对冲
+    LLM_HEDGE_MIN_DELAY: float = 1.0  # 对冲触发时间下限（秒）
+    
+    # 生成参数预算（JSON 字符串格式），键为意图（derivation/code/concept）或调用点（recursive），
+    # default 为兜底配置
+    LLM_GENERATION_PROFILES: str = (
+        '{"default":{"temperature":0.7,"max_tokens":2000},'
+        '"concept":{"temperature":0.7,"max_tokens":1500},'
+        '"derivation":{"temperature":0.3,"max_tokens":3000},'
+        '"code":{"temperature":0.2,"max_tokens":2500},'
+        '"recursive":{"temperature":0.5,"max_tokens":600}}'
+    )
+    LLM_ADAPTIVE_MAX_TOKENS: bool = False  # 按观测到的输出长度分布自适应 max_tokens
+    LLM_ADAPTIVE_PERCENTILE: float = 95.0
+    LLM_ADAPTIVE_HEADROOM: float = 1.2  # 在分位数基础上预留的余量倍数
+    LLM_ADAPTIVE_MIN_SAMPLES: int = 30
+    LLM_ADAPTIVE_MIN_TOKENS: int = 128
+    
+    # LLM 响应缓存（内存 LRU/TTL + 磁盘持久化）
+    LLM_CACHE_ENABLED: bool = False
+    LLM_CACHE_INTENTS: str = '["concept"]'  # JSON 字符串格式，启用缓存的意图列表
+    LLM_CACHE_MAX_ENTRIES: int = 1024
+    LLM_CACHE_TTL_SECONDS: int = 86400
+    LLM_CACHE_DIR: str = "backend/storage/llm_cache"  # 为空则只使用内存缓存
+    LLM_CACHE_DISK_MAX_MB: int = 512  # 磁盘缓存总大小上限，超出时删除最旧的文件；0 表示不限制
+    LLM_CACHE_DISK_SWEEP_INTERVAL: float = 300.0  # 磁盘缓存清理间隔（秒）
+    LLM_REPLAY_DELAY_MS: float = 0  # 缓存命中回放时片段间隔（毫秒），0 为全速
+    
+    # 语义答案缓存（基于向量存储的嵌入模型）
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # 余弦相似度阈值
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 5000  # 每个意图的最大条目数
+    
     # Neo4j 配置
     NEO4J_URI: str = "bolt://localhost:7687"
     NEO4J_USER: str = "neo4j"
     NEO4J_PASSWORD: str
+    NEO4J_DATABASE: str = ""  # 目标数据库，空表示使用服务端默认库
+    NEO4J_MAX_TRANSACTION_RETRY_TIME: float = 15.0  # 托管事务遇到瞬时错误时的最长重试时间（秒）
+    NEO4J_MAX_POOL_SIZE: int = 100  # 连接池最大连接数
+    NEO4J_CONNECTION_ACQUISITION_TIMEOUT: float = 30.0  # 从连接池获取连接的最长等待（秒）
+    NEO4J_MAX_CONNECTION_LIFETIME: float = 3600.0  # 连接最长存活时间（秒），应小于防火墙/负载均衡的空闲超时
+    NEO4J_POOL_WARMUP: int = 10  # 启动时预先建立的连接数
+    NEO4J_SCHEMA_BOOTSTRAP: bool = True  # 启动时执行约束/索引迁移
+    
+    # 对话写后队列（流式回答结束后批量异步写入 Neo4j）
+    NEO4J_WRITE_BEHIND_ENABLED: bool = True
+    NEO4J_WRITE_QUEUE_MAX: int = 10000  # 队列上限，队满时等待空位
+    NEO4J_WRITE_BATCH_SIZE: int = 100
+    NEO4J_WRITE_FLUSH_INTERVAL: float = 0.5  # 秒
+    NEO4J_WRITE_ENQUEUE_TIMEOUT: float = 2.0  # 队满时入队的最长等待时间（秒），超时后降级为同步写入
+    
+    # 学习路径（内存中的前置闭包缓存）
+    LEARNING_PATH_GRAPH_TTL: float = 600.0  # 前置关系图重新加载周期（秒）
+    LEARNING_PATH_MAX_CACHED: int = 10000  # 最多缓存的闭包数
+    LEARNING_PATH_MAX_DEPTH: int = 50  # 前置链最大展开深度
     
     # JWT 配置
     JWT_SECRET_KEY: str
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRATION_HOURS: int = 24
+    JWT_CACHE_MAX_ENTRIES: int = 10000  # 已验证 token 缓存条目数，0 表示禁用（此时按用户限流的规则退化为按 IP）
+    
+    # 密码哈希（bcrypt 在独立执行器中计算，不阻塞事件循环）
+    PASSWORD_HASH_EXECUTOR: str = "thread"  # thread 或 process
+    PASSWORD_HASH_WORKERS: int = 4  # 并发哈希数
+    PASSWORD_HASH_MAX_PENDING: int = 256  # 排队上限，超出时返回 503
+    
+    # 批量开通用户
+    ADMIN_USER_IDS: str = '[]'  # 可调用管理接口（批量开通、/metrics）的用户 ID，JSON 字符串格式
+    USER_PROVISION_MAX_ROWS: int = 1000  # 单次最多开通的用户数
     
     # SQLite 数据库
     SQLITE_DB_PATH: str = "backend/storage/deepstudy.db"
+    SQLITE_POOL_SIZE: int = 4  # 只读连接数（另有 1 个写连接）
+    SQLITE_CACHE_SIZE_KB: int = 16384  # 每个连接的页缓存（KB）
+    SQLITE_MMAP_SIZE: int = 268435456  # 内存映射读取的上限（字节）
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # 等待锁的最长时间（毫秒）
+    
+    # 限流（令牌桶，per_minute 为每分钟补充的令牌数，burst 为桶容量）
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_RULES: str = (
+        '[{"path": "/api/auth/login", "methods": ["POST"], "scope": "ip", "per_minute": 10, "burst": 10},'
+        ' {"path": "/api/auth/register", "methods": ["POST"], "scope": "ip", "per_minute": 3, "burst": 5},'
+        ' {"path": "/api/chat", "methods": ["POST"], "scope": "user", "per_minute": 20, "burst": 10},'
+        ' {"path": "/api/chat", "methods": ["POST"], "scope": "ip", "per_minute": 120, "burst": 60}]'
+    )  # JSON 字符串格式
+    RATE_LIMIT_TRUSTED_PROXY_HOPS: int = 0  # 应用前的可信反向代理层数，按 X-Forwarded-For 从右数第 N 个识别客户端；0 表示不使用
+    RATE_LIMIT_SWEEP_INTERVAL: float = 60.0  # 清理空闲键的间隔（秒）
     
     # 向量存储
     VECTOR_STORE_PATH: str = "backend/storage/vector_store"
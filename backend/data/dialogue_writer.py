@@ -0,0 +1,168 @@
+"""
+对话写后队列（write-behind）
+流式回答结束后只把对话轮次放入内存队列，由后台任务按批次大小或时间阈值
+用 UNWIND 批量写入 Neo4j，聊天响应不再等待数据库写入
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.data.neo4j_client import Neo4jClient
+
+logger = logging.getLogger(__name__)
+
+
+class DialogueWriteBehindQueue:
+    """
+    对话写后队列
+
+    - 队列有界：队满时 enqueue 最多等待 enqueue_timeout 秒，仍无空位（或后台任务未运行）时返回 False，
+      由调用方决定降级为同步写入
+    - 批次写入失败会按退避重试，仍失败则丢弃该批，并在错误日志中记录被丢弃的节点 ID 以便补写
+    - stop() 会把队列中剩余的对话全部写完
+    """
+
+    def __init__(
+        self,
+        client: Neo4jClient,
+        max_queue: int = 10000,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_retries: int = 3,
+        enqueue_timeout: float = 2.0,
+    ):
+        """
+        初始化写后队列
+
+        Args:
+            client: Neo4j 客户端
+            max_queue: 队列最大长度（限制内存占用）
+            batch_size: 单批最多写入的对话轮次数
+            flush_interval: 批次最长等待时间（秒）
+            max_retries: 批次写入失败时的重试次数
+            enqueue_timeout: 队满时入队的最长等待时间（秒）
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task: Optional[asyncio.Task] = None
+        # 后台任务被取消时已取出但未确认写入的批次（MERGE 幂等，重复写入无害）
+        self._carry: List[Dict] = []
+        self._stats = {
+            "enqueued": 0,
+            "rejected": 0,
+            "flushed_rows": 0,
+            "flushed_batches": 0,
+            "failed_batches": 0,
+            "dropped_rows": 0,
+            "flush_latency_last": 0.0,
+            "flush_latency_max": 0.0,
+        }
+
+    def start(self) -> None:
+        """启动后台写入任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("对话写后队列已启动")
+
+    async def stop(self) -> None:
+        """停止后台任务并写完队列中剩余的对话"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+        remaining, self._carry = self._carry, []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        for i in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[i:i + self.batch_size])
+        logger.info("对话写后队列已停止，关闭时写入 %s 轮对话", len(remaining))
+
+    async def enqueue(self, row: Dict) -> bool:
+        """
+        放入一轮对话，队满时最多等待 enqueue_timeout 秒
+
+        等待空位而不是立即降级，是为了让同一对话树中先入队的父节点先写入；
+        否则调用方的同步写入可能早于队列中的父节点，父子关系会丢失。
+
+        Args:
+            row: Neo4jClient.dialogue_turn_row 构造的参数
+
+        Returns:
+            是否成功入队（后台任务未运行或等待超时时返回 False）
+        """
+        if self._task is None:
+            self._stats["rejected"] += 1
+            return False
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            try:
+                await asyncio.wait_for(self._queue.put(row), self.enqueue_timeout)
+            except asyncio.TimeoutError:
+                self._stats["rejected"] += 1
+                return False
+        self._stats["enqueued"] += 1
+        return True
+
+    async def _run(self) -> None:
+        """后台循环：攒够一批或等待超时后写入"""
+        loop = asyncio.get_running_loop()
+        batch: List[Dict] = []
+        try:
+            while True:
+                batch.append(await self._queue.get())
+                deadline = loop.time() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                await self._flush(batch)
+                batch = []
+        except asyncio.CancelledError:
+            # 交给 stop() 在队列剩余内容之前写入，保持父子节点的写入顺序
+            self._carry = batch
+            raise
+
+    async def _flush(self, rows: List[Dict]) -> None:
+        """写入一批对话，失败时按退避重试"""
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.client.save_dialogue_turns(rows)
+                break
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    self._stats["failed_batches"] += 1
+                    self._stats["dropped_rows"] += len(rows)
+                    logger.error(
+                        "批量写入对话到 Neo4j 失败，丢弃 %s 轮对话: %s", len(rows), str(e),
+                        exc_info=True,
+                    )
+                    logger.error(
+                        "被丢弃的对话节点（user_node_id -> ai_node_id，parent_id）: %s",
+                        [(row["user_node_id"], row["ai_node_id"], row.get("parent_id")) for row in rows],
+                    )
+                    return
+                logger.warning("批量写入对话到 Neo4j 失败，准备重试: %s", str(e))
+                await asyncio.sleep(0.5 * (2 ** attempt))
+
+        latency = time.monotonic() - started
+        self._stats["flushed_rows"] += len(rows)
+        self._stats["flushed_batches"] += 1
+        self._stats["flush_latency_last"] = latency
+        self._stats["flush_latency_max"] = max(self._stats["flush_latency_max"], latency)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回队列深度与写入指标"""
+        return {**self._stats, "queue_depth": self._queue.qsize()}
@@ -0,0 +1,336 @@
+"""
+Concept 知识图谱批量导入脚本
+从 JSONL/CSV 课程文件流式读取概念与前置关系（REQUIRES/PART_OF），
+按批次 UNWIND ... MERGE 写入 Neo4j，多个批次并行执行，支持断点续传
+
+用法:
+    python -m backend.data.import_concepts --concepts concepts.jsonl --edges edges.csv
+    python -m backend.data.import_concepts --edges edges.csv --resume
+
+文件格式:
+    概念: 每行一个概念，必须有 name 字段，其余字段作为节点属性
+    关系: 每行一条关系，必须有 source、target 字段，type 为 REQUIRES（默认）或 PART_OF，
+          其余字段作为关系属性；source 依赖/属于 target
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from backend.data.neo4j_client import Neo4jClient, neo4j_client
+
+RELATION_TYPES = ("REQUIRES", "PART_OF")
+DEFAULT_CHECKPOINT = "backend/storage/import_concepts.checkpoint.json"
+# 最多保留并在结束时打印的失败行数
+MAX_REPORTED_FAILURES = 100
+
+
+def read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐行读取 JSONL 或 CSV 文件（按扩展名判断），内存占用与文件大小无关
+
+    CSV 中的空字符串视为缺失字段。
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {k: v for k, v in row.items() if k and v not in (None, "")}
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+
+def file_fingerprint(path: str) -> str:
+    """文件指纹（大小 + 修改时间），文件变化后断点失效"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
+
+
+class Checkpoint:
+    """
+    断点文件
+
+    每个阶段记录已连续完成的行数（低水位），并行批次乱序完成时只推进到
+    第一个未完成批次之前；写入失败的批次不算完成，低水位停在它之前。
+    续传时从该行开始，重复写入的批次由 MERGE 保证幂等。
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.state: Dict[str, Dict[str, Any]] = {}
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def rows_done(self, phase: str, source: str) -> int:
+        """返回该阶段已完成的行数（文件变化时为 0）"""
+        entry = self.state.get(phase)
+        if not entry or entry.get("source") != source or entry.get("fingerprint") != file_fingerprint(source):
+            return 0
+        return entry.get("rows_done", 0)
+
+    def update(self, phase: str, source: str, rows_done: int, completed: bool = False) -> None:
+        """记录进度并原子写入断点文件"""
+        self.state[phase] = {
+            "source": source,
+            "fingerprint": file_fingerprint(source),
+            "rows_done": rows_done,
+            "completed": completed,
+        }
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class Progress:
+    """导入进度统计，按固定间隔打印"""
+
+    def __init__(self, phase: str, start_row: int, interval: float = 5.0):
+        self.phase = phase
+        self.start_row = start_row
+        self.interval = interval
+        self.rows = 0
+        self.written = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last_report = self.started
+
+    def add(self, rows: int, written: int, failed: int) -> None:
+        self.rows += rows
+        self.written += written
+        self.failed += failed
+        now = time.monotonic()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        label = "完成" if final else "进行中"
+        print(
+            f"[{self.phase}] {label}: 已处理 {self.start_row + self.rows} 行"
+            f"（本次 {self.rows} 行，写入 {self.written}，失败 {self.failed}），"
+            f"{self.rows / elapsed:.0f} 行/秒"
+        )
+
+
+class ConceptImporter:
+    """
+    概念图谱导入器
+
+    文件读取与解析在线程中进行（不阻塞事件循环），切好的批次放入有界队列，workers 个协程并行写入，
+    同时在途的事务数（即占用的会话数）不超过 workers，内存只与 workers × batch_size 有关。
+    """
+
+    def __init__(
+        self,
+        client: Neo4jClient,
+        batch_size: int = 1000,
+        workers: int = 4,
+        checkpoint: Optional[Checkpoint] = None,
+    ):
+        """
+        初始化导入器
+
+        Args:
+            client: Neo4j 客户端
+            batch_size: 每个事务写入的行数
+            workers: 并行写入的批次数
+            checkpoint: 断点记录（None 表示不记录）
+        """
+        self.client = client
+        self.batch_size = batch_size
+        self.workers = workers
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.failures: List[Dict[str, Any]] = []
+
+    async def import_concepts(self, path: str) -> Progress:
+        """导入概念节点"""
+        return await self._run("concepts", path, self._write_concepts)
+
+    async def import_edges(self, path: str) -> Progress:
+        """导入前置关系"""
+        return await self._run("edges", path, self._write_edges)
+
+    async def _write_concepts(self, rows: List[Dict[str, Any]]) -> Tuple[List[Dict], bool]:
+        """
+        写入一批概念
+
+        Returns:
+            (失败的行, 事务是否失败)；缺少 name 等数据问题只计入失败行，
+            合法行也返回 error 说明事务本身失败（驱动重试后仍失败），该批次需要续传时重试
+        """
+        outcomes = await self.client.bulk_upsert_nodes(
+            "Concept", rows, key="name", chunk_size=len(rows)
+        )
+        failures = [outcome for outcome in outcomes if outcome["status"] == "error"]
+        return failures, any(failure["key"] is not None for failure in failures)
+
+    async def _write_edges(self, rows: List[Dict[str, Any]]) -> Tuple[List[Dict], bool]:
+        """写入一批关系，返回值同 _write_concepts（端点不存在属于数据问题）"""
+        failures = []
+        batch_failed = False
+        by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            relation_type = str(row.get("type") or "REQUIRES").upper()
+            if relation_type not in RELATION_TYPES:
+                failures.append({**row, "status": "error", "error": f"不支持的关系类型 {relation_type}"})
+                continue
+            properties = {k: v for k, v in row.items() if k not in ("source", "target", "type")}
+            by_type.setdefault(relation_type, []).append(
+                {"source": row.get("source"), "target": row.get("target"), "properties": properties}
+            )
+        for relation_type, edges in by_type.items():
+            outcomes = await self.client.bulk_merge_relationships(
+                relation_type, edges, label="Concept", key="name", chunk_size=len(edges)
+            )
+            failures.extend(
+                outcome for outcome in outcomes if outcome["status"] not in ("created", "exists")
+            )
+            batch_failed = batch_failed or any(
+                outcome["status"] == "error"
+                and outcome["source"] is not None and outcome["target"] is not None
+                for outcome in outcomes
+            )
+        return failures, batch_failed
+
+    async def _run(self, phase: str, path: str, write) -> Progress:
+        """流式切批并行写入，按低水位推进断点（失败批次之后的行在续传时重新写入）"""
+        start_row = self.checkpoint.rows_done(phase, path)
+        if start_row:
+            print(f"[{phase}] 从断点续传，跳过前 {start_row} 行")
+        progress = Progress(phase, start_row)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        # 已完成但尚未连续的批次：起始行 -> 结束行
+        finished: Dict[int, int] = {}
+        watermark = start_row
+        # 写入失败的批次起始行；这些批次不进入 finished，低水位不会越过它们
+        failed_batches: List[int] = []
+
+        def advance(batch_start: int, batch_end: int) -> None:
+            nonlocal watermark
+            finished[batch_start] = batch_end
+            moved = False
+            while watermark in finished:
+                watermark = finished.pop(watermark)
+                moved = True
+            if moved:
+                self.checkpoint.update(phase, path, watermark)
+
+        async def worker() -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                batch_start, batch = item
+                try:
+                    failures, batch_failed = await write(batch)
+                except Exception as e:
+                    failures, batch_failed = [{"status": "error", "error": str(e)}] * len(batch), True
+                room = MAX_REPORTED_FAILURES - len(self.failures)
+                if room > 0:
+                    self.failures.extend(failures[:room])
+                progress.add(len(batch), len(batch) - len(failures), len(failures))
+                if batch_failed:
+                    failed_batches.append(batch_start)
+                else:
+                    advance(batch_start, batch_start + len(batch))
+
+        tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        batches = self._batches(path, start_row)
+        try:
+            while True:
+                item = await asyncio.to_thread(next, batches, None)
+                if item is None:
+                    break
+                await queue.put(item)
+            for _ in tasks:
+                await queue.put(None)
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+
+        self.checkpoint.update(phase, path, watermark, completed=not failed_batches)
+        progress.report(final=True)
+        if failed_batches:
+            print(
+                f"[{phase}] {len(failed_batches)} 个批次写入失败，断点停在第 {watermark} 行，"
+                f"排除问题后使用 --resume 从该行重新导入"
+            )
+        return progress
+
+    def _batches(self, path: str, start_row: int) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        """跳过已完成的行后按 batch_size 切批，产出 (批次起始行, 行列表)"""
+        batch: List[Dict[str, Any]] = []
+        batch_start = start_row
+        for row_number, row in enumerate(read_rows(path)):
+            if row_number < start_row:
+                continue
+            if not batch:
+                batch_start = row_number
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                yield batch_start, batch
+                batch = []
+        if batch:
+            yield batch_start, batch
+
+
+async def main(args: argparse.Namespace) -> None:
+    """执行导入"""
+    checkpoint_path = args.checkpoint
+    if not args.resume and checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    importer = ConceptImporter(
+        neo4j_client,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        checkpoint=Checkpoint(checkpoint_path),
+    )
+    try:
+        await neo4j_client.start(warmup=args.workers)
+        print("正在执行 Neo4j schema 迁移...")
+        await neo4j_client.ensure_schema()
+        if args.concepts:
+            await importer.import_concepts(args.concepts)
+        if args.edges:
+            await importer.import_edges(args.edges)
+    finally:
+        await neo4j_client.close()
+
+    if importer.failures:
+        print(f"部分行写入失败，前 {len(importer.failures)} 条:")
+        for failure in importer.failures:
+            print(f"  {json.dumps(failure, ensure_ascii=False, default=str)}")
+    print("导入完成！运行中的服务会在学习路径前置关系图过期后加载新数据。")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="批量导入 Concept 知识图谱")
+    parser.add_argument("--concepts", help="概念文件（.jsonl 或 .csv）")
+    parser.add_argument("--edges", help="前置关系文件（.jsonl 或 .csv）")
+    parser.add_argument("--batch-size", type=int, default=1000, help="每个事务写入的行数")
+    parser.add_argument("--workers", type=int, default=4, help="并行写入的批次数（同时占用的会话数）")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="断点文件路径")
+    parser.add_argument("--resume", action="store_true", help="从断点文件续传")
+    args = parser.parse_args(argv)
+    if not args.concepts and not args.edges:
+        parser.error("至少需要指定 --concepts 或 --edges")
+    return args
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
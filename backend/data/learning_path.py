@@ -0,0 +1,252 @@
+"""
+学习路径服务
+把 Concept 的前置关系（REQUIRES/PART_OF）加载到内存，按目标概念惰性计算并缓存前置闭包，
+返回最短学习路径、按长度排序的备选路径以及按依赖顺序排列的全部前置概念
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from backend.data.neo4j_client import Neo4jClient
+
+logger = logging.getLogger(__name__)
+
+
+class PrerequisiteClosure:
+    """单个目标概念的前置闭包"""
+
+    def __init__(self, target: str, concepts: Set[str], paths: List[List[str]], order: List[str]):
+        """
+        Args:
+            target: 目标概念
+            concepts: 闭包内的全部概念（含目标本身）
+            paths: 从各个基础概念到目标的最短路径，按长度升序
+            order: 全部前置概念的学习顺序（被依赖的在前，不含目标）
+        """
+        self.target = target
+        self.concepts = concepts
+        self.paths = paths
+        self.order = order
+
+
+class LearningPathService:
+    """
+    学习路径服务
+
+    - 前置关系图整体加载到内存，超过 ttl_seconds 后在下一次查询时重新加载
+    - 每个目标的闭包计算一次后缓存（LRU），并登记闭包内的概念到反向索引
+    - 本进程写入前置关系时（通过 Neo4jClient 的前置关系监听器）只失效闭包中包含变更起点的目标（增量失效）
+    """
+
+    def __init__(
+        self,
+        client: Neo4jClient,
+        ttl_seconds: float = 600.0,
+        max_cached: int = 10000,
+        max_depth: int = 50,
+    ):
+        """
+        初始化服务
+
+        Args:
+            client: Neo4j 客户端
+            ttl_seconds: 前置关系图的最长缓存时间（秒），用于兜底其他进程写入的变更
+            max_cached: 最多缓存的闭包数
+            max_depth: 前置链的最大展开深度
+        """
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.max_cached = max_cached
+        self.max_depth = max_depth
+
+        self._requires: Optional[Dict[str, Set[str]]] = None
+        self._loaded_at = 0.0
+        self._load_lock = asyncio.Lock()
+        self._closures: "OrderedDict[str, PrerequisiteClosure]" = OrderedDict()
+        # 概念 -> 闭包中包含该概念的已缓存目标
+        self._cached_by_concept: Dict[str, Set[str]] = {}
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "reloads": 0}
+
+    async def _graph(self) -> Dict[str, Set[str]]:
+        """返回前置关系图，首次使用或过期时从 Neo4j 加载"""
+        if self._requires is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return self._requires
+        async with self._load_lock:
+            if self._requires is None or time.monotonic() - self._loaded_at >= self.ttl_seconds:
+                await self.refresh()
+        return self._requires
+
+    async def refresh(self) -> None:
+        """从 Neo4j 重新加载前置关系图并清空所有闭包"""
+        started = time.monotonic()
+        graph = await self.client.get_prerequisite_graph()
+        self._requires = {name: set(prerequisites) for name, prerequisites in graph.items()}
+        self._loaded_at = time.monotonic()
+        self._closures.clear()
+        self._cached_by_concept.clear()
+        self._stats["reloads"] += 1
+        logger.info(
+            "学习路径前置关系图已加载: %s 个概念，耗时 %.2f 秒",
+            len(self._requires), self._loaded_at - started,
+        )
+
+    async def get_paths(self, targets: List[str], alternatives: int = 2) -> Dict[str, Dict[str, Any]]:
+        """
+        批量查询学习路径
+
+        Args:
+            targets: 目标概念名列表
+            alternatives: 除最短路径外最多返回的备选路径数
+
+        Returns:
+            {目标: {"found", "path", "alternatives", "prerequisites"}}；
+            path 从基础概念开始、以目标结束，目标没有前置时为 [目标]，目标不存在时为空
+        """
+        requires = await self._graph()
+        results = {}
+        for target in dict.fromkeys(targets):
+            if target not in requires:
+                results[target] = {"found": False, "path": [], "alternatives": [], "prerequisites": []}
+                continue
+            closure = self._closure(requires, target)
+            results[target] = {
+                "found": True,
+                "path": closure.paths[0],
+                "alternatives": closure.paths[1:1 + alternatives],
+                "prerequisites": closure.order,
+            }
+        return results
+
+    async def get_learning_path(self, target: str) -> List[str]:
+        """返回单个目标概念的最短学习路径"""
+        return (await self.get_paths([target], alternatives=0))[target]["path"]
+
+    def _closure(self, requires: Dict[str, Set[str]], target: str) -> PrerequisiteClosure:
+        """取缓存的闭包，未命中时计算并登记"""
+        closure = self._closures.get(target)
+        if closure is not None:
+            self._closures.move_to_end(target)
+            self._stats["hits"] += 1
+            return closure
+
+        self._stats["misses"] += 1
+        closure = self._compute(requires, target)
+        self._closures[target] = closure
+        for concept in closure.concepts:
+            self._cached_by_concept.setdefault(concept, set()).add(target)
+        while len(self._closures) > self.max_cached:
+            evicted, evicted_closure = self._closures.popitem(last=False)
+            self._unindex(evicted, evicted_closure)
+        return closure
+
+    def _compute(self, requires: Dict[str, Set[str]], target: str) -> PrerequisiteClosure:
+        """
+        广度优先展开前置关系
+
+        BFS 第一次到达某概念时的前驱即最短路径上的前驱；
+        每个基础概念（没有前置的概念）对应一条最短路径，按长度、名称排序。
+        """
+        previous: Dict[str, Optional[str]] = {target: None}
+        depth = {target: 0}
+        roots = []
+        queue = deque([target])
+        while queue:
+            concept = queue.popleft()
+            prerequisites = requires.get(concept) or ()
+            if not prerequisites:
+                roots.append(concept)
+                continue
+            if depth[concept] >= self.max_depth:
+                continue
+            for prerequisite in sorted(prerequisites):
+                if prerequisite not in previous:
+                    previous[prerequisite] = concept
+                    depth[prerequisite] = depth[concept] + 1
+                    queue.append(prerequisite)
+
+        paths = []
+        for root in sorted(roots, key=lambda name: (depth[name], name)):
+            path = [root]
+            while previous[path[-1]] is not None:
+                path.append(previous[path[-1]])
+            paths.append(path)
+        if not paths:
+            # 前置关系成环或超过最大深度，没有可达的基础概念
+            paths = [[target]]
+
+        return PrerequisiteClosure(target, set(previous), paths, self._study_order(requires, target, previous))
+
+    @staticmethod
+    def _study_order(requires: Dict[str, Set[str]], target: str, closure: Dict[str, Any]) -> List[str]:
+        """闭包内的拓扑顺序（迭代式 DFS 后序，被依赖的概念在前；成环时按首次访问断开）"""
+        order = []
+        visited = {target}
+        stack = [(target, iter(sorted(requires.get(target) or ())))]
+        while stack:
+            concept, children = stack[-1]
+            for child in children:
+                if child in closure and child not in visited:
+                    visited.add(child)
+                    stack.append((child, iter(sorted(requires.get(child) or ()))))
+                    break
+            else:
+                stack.pop()
+                if concept != target:
+                    order.append(concept)
+        return order
+
+    def _forget(self, target: str) -> None:
+        """失效一个目标的闭包"""
+        closure = self._closures.pop(target, None)
+        if closure is not None:
+            self._unindex(target, closure)
+
+    def _unindex(self, target: str, closure: PrerequisiteClosure) -> None:
+        """从反向索引中移除一个目标的闭包"""
+        for concept in closure.concepts:
+            targets = self._cached_by_concept.get(concept)
+            if targets is not None:
+                targets.discard(target)
+                if not targets:
+                    del self._cached_by_concept[concept]
+
+    def on_edges_changed(
+        self, added: Iterable[Tuple[str, str]] = (), removed: Iterable[Tuple[str, str]] = ()
+    ) -> int:
+        """
+        前置关系变更后增量更新（登记为 Neo4jClient 的前置关系监听器）
+
+        Args:
+            added: 新增的 (概念, 前置概念) 边
+            removed: 删除的 (概念, 前置概念) 边
+
+        Returns:
+            被失效的闭包数
+        """
+        affected: Set[str] = set()
+        for edges, adding in ((added, True), (removed, False)):
+            for concept, prerequisite in edges:
+                if self._requires is not None:
+                    if adding:
+                        self._requires.setdefault(concept, set()).add(prerequisite)
+                        self._requires.setdefault(prerequisite, set())
+                    elif concept in self._requires:
+                        self._requires[concept].discard(prerequisite)
+                affected |= self._cached_by_concept.get(concept, set())
+
+        for target in affected:
+            self._forget(target)
+        self._stats["invalidations"] += len(affected)
+        return len(affected)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回闭包缓存指标"""
+        lookups = self._stats["hits"] + self._stats["misses"]
+        return {
+            **self._stats,
+            "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            "concepts": len(self._requires) if self._requires is not None else 0,
+            "cached_closures": len(self._closures),
+        }
@@ -1,7 +1,13 @@
+import asyncio
+import base64
+import json
 import logging
-from typing import List, Dict, Optional
+import re
+import time
+from collections import deque
+from typing import Any, Callable, Iterable, List, Dict, Optional, Tuple
 from datetime import datetime
-from neo4j import AsyncGraphDatabase
+from neo4j import AsyncGraphDatabase, READ_ACCESS, WRITE_ACCESS
 from neo4j.exceptions import (
     ServiceUnavailable, 
     AuthError, 
@@ -10,29 +16,195 @@ from neo4j.exceptions import (
 )
 from backend.config import settings
 
-# 配置日志
 logger = logging.getLogger("neo4j_client")
-logging.basicConfig(level=logging.INFO)
+
+# 构成学习前置关系的关系类型（Concept 之间）
+PREREQUISITE_TYPES = ("REQUIRES", "PART_OF")
+
+# 版本化的 schema 迁移：(版本号, 说明, 语句列表)
+# 语句均为幂等写法（IF NOT EXISTS / IF EXISTS），名称用于启动时校验（DROP 语句的名称不再校验）
+SCHEMA_MIGRATIONS = [
+    (
+        1,
+        "DialogueNode/Concept 约束与索引",
+        [
+            ("dialogue_node_id_unique",
+             "CREATE CONSTRAINT dialogue_node_id_unique IF NOT EXISTS "
+             "FOR (n:DialogueNode) REQUIRE n.node_id IS UNIQUE"),
+            ("dialogue_node_user_id",
+             "CREATE INDEX dialogue_node_user_id IF NOT EXISTS "
+             "FOR (n:DialogueNode) ON (n.user_id)"),
+            ("dialogue_node_timestamp",
+             "CREATE INDEX dialogue_node_timestamp IF NOT EXISTS "
+             "FOR (n:DialogueNode) ON (n.timestamp)"),
+            ("concept_name",
+             "CREATE INDEX concept_name IF NOT EXISTS "
+             "FOR (n:Concept) ON (n.name)"),
+        ],
+    ),
+    (
+        2,
+        "Concept 名称唯一约束（批量导入并发 MERGE 所需）",
+        [
+            # 同一属性上已有普通索引时无法创建唯一约束，先删除 v1 的索引
+            ("concept_name", "DROP INDEX concept_name IF EXISTS"),
+            ("concept_name_unique",
+             "CREATE CONSTRAINT concept_name_unique IF NOT EXISTS "
+             "FOR (n:Concept) REQUIRE n.name IS UNIQUE"),
+        ],
+    ),
+]
+
+
+def _expected_schema_names() -> List[str]:
+    """按迁移顺序推算最终应存在的约束/索引名称"""
+    expected: Dict[str, None] = {}
+    for _, _, statements in SCHEMA_MIGRATIONS:
+        for name, statement in statements:
+            if statement.lstrip().upper().startswith("DROP"):
+                expected.pop(name, None)
+            else:
+                expected[name] = None
+    return list(expected)
+
+# 标签、关系类型、属性名只能拼接进 Cypher，必须是合法标识符
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _check_identifier(name: str, kind: str) -> str:
+    """校验拼接进 Cypher 的标识符，不合法时抛出 ValueError"""
+    if not isinstance(name, str) or not _IDENTIFIER.match(name):
+        raise ValueError(f"非法的{kind}: {name!r}")
+    return name
+
+
+def _chunks(items: List, size: int):
+    """按固定大小切分列表，产出 (起始下标, 分片)"""
+    for start in range(0, len(items), size):
+        yield start, items[start:start + size]
+
+
+def _encode_cursor(timestamp: Optional[str], node_id: str) -> str:
+    """把 (timestamp, node_id) 编码为不透明的分页游标"""
+    raw = json.dumps([timestamp, node_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[Optional[str], str]:
+    """解析分页游标，格式不合法时抛出 ValueError"""
+    try:
+        timestamp, node_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"无效的分页游标: {cursor}") from e
+    return timestamp, node_id
+
+
+def _tree_node_projection(var: str) -> str:
+    """树分页查询中节点的投影：按需截断 content，只返回预览"""
+    return _TREE_NODE_PROJECTION % {"n": var}
+
+
+_TREE_NODE_PROJECTION = """{
+    .node_id, .user_id, .role, .intent, .mastery_score, .timestamp,
+    content: CASE WHEN $preview_chars > 0 THEN left(coalesce(%(n)s.content, ''), $preview_chars)
+                  ELSE coalesce(%(n)s.content, '') END,
+    content_length: size(coalesce(%(n)s.content, '')),
+    child_count: COUNT { (%(n)s)-[:HAS_CHILD]->(:DialogueNode) }
+}"""
+
 
 class Neo4jClient:
     """Neo4j 客户端（整合版：包含基础功能、学习路径及对话记忆）"""
     
     def __init__(self):
-        """初始化 Neo4j 客户端并建立连接池"""
+        """
+        初始化 Neo4j 客户端
+        
+        构造时不创建驱动，驱动在 start()（应用 lifespan）或首次使用时创建，
+        导入本模块不会产生任何网络连接。
+        """
         self._uri = settings.NEO4J_URI
         self._user = settings.NEO4J_USER
         self._password = settings.NEO4J_PASSWORD
-        self.driver = None
+        self._database = settings.NEO4J_DATABASE or None
+        self._driver = None
+        # 从开始事务到拿到连接（含 BEGIN 往返）的等待时间，反映连接池是否耗尽
+        self._acquire_waits: deque = deque(maxlen=1000)
+        self._pool_stats = {
+            "acquired": 0,
+            "acquire_failures": 0,
+            "acquire_wait_total": 0.0,
+            "acquire_wait_max": 0.0,
+            "in_flight": 0,
+        }
+        # 前置关系变更监听器：callback(added=[(概念, 前置概念), ...])
+        self._prerequisite_listeners: List[Callable[..., Any]] = []
 
-        try:
-            self.driver = AsyncGraphDatabase.driver(
-                self._uri,
-                auth=(self._user, self._password)
-            )
-            logger.info(f"Neo4j driver initialized at {self._uri}")
-        except Exception as e:
-            logger.error(f"Failed to initialize Neo4j driver: {e}")
-            raise e
+    def add_prerequisite_listener(self, callback: Callable[..., Any]) -> None:
+        """登记前置关系变更监听器（本进程写入 Concept 间的 REQUIRES/PART_OF 后调用）"""
+        self._prerequisite_listeners.append(callback)
+
+    def remove_prerequisite_listener(self, callback: Callable[..., Any]) -> None:
+        """注销前置关系变更监听器"""
+        if callback in self._prerequisite_listeners:
+            self._prerequisite_listeners.remove(callback)
+
+    def _notify_prerequisites(self, relation_type: str, added: Iterable[Tuple[str, str]]) -> None:
+        """通知监听器新增了前置关系（监听器出错只记录日志，不影响写入结果）"""
+        if relation_type not in PREREQUISITE_TYPES or not self._prerequisite_listeners:
+            return
+        added = [edge for edge in added if edge[0] is not None and edge[1] is not None]
+        if not added:
+            return
+        for callback in self._prerequisite_listeners:
+            try:
+                callback(added=added)
+            except Exception as e:
+                logger.warning(f"Prerequisite listener failed: {e}")
+
+    @property
+    def driver(self):
+        """Neo4j 驱动（惰性创建）"""
+        if self._driver is None:
+            try:
+                self._driver = AsyncGraphDatabase.driver(
+                    self._uri,
+                    auth=(self._user, self._password),
+                    max_transaction_retry_time=settings.NEO4J_MAX_TRANSACTION_RETRY_TIME,
+                    max_connection_pool_size=settings.NEO4J_MAX_POOL_SIZE,
+                    connection_acquisition_timeout=settings.NEO4J_CONNECTION_ACQUISITION_TIMEOUT,
+                    max_connection_lifetime=settings.NEO4J_MAX_CONNECTION_LIFETIME,
+                )
+                logger.info(f"Neo4j driver initialized at {self._uri}")
+            except Exception as e:
+                logger.error(f"Failed to initialize Neo4j driver: {e}")
+                raise e
+        return self._driver
+
+    async def start(self, warmup: Optional[int] = None) -> None:
+        """
+        创建驱动、验证连通性并预热连接池（在应用 lifespan 中调用）
+        
+        Args:
+            warmup: 预先建立的连接数，默认取 NEO4J_POOL_WARMUP
+            
+        Raises:
+            ServiceUnavailable, AuthError: 数据库不可达或认证失败
+        """
+        await self.verify_connectivity()
+        warmup = settings.NEO4J_POOL_WARMUP if warmup is None else warmup
+        warmup = min(warmup, settings.NEO4J_MAX_POOL_SIZE)
+        if warmup <= 0:
+            return
+        
+        async def ping() -> None:
+            async with self._session(read=True) as session:
+                await (await session.run("RETURN 1")).consume()
+        
+        # 并发执行，迫使连接池同时持有 warmup 个连接
+        results = await asyncio.gather(*(ping() for _ in range(warmup)), return_exceptions=True)
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        logger.info(f"Neo4j connection pool warmed up: {warmup - failed}/{warmup} connections")
 
     async def verify_connectivity(self):
         """验证数据库连接是否可用"""
@@ -43,10 +215,144 @@ class Neo4jClient:
             logger.error(f"Neo4j connection verification failed: {e}")
             raise
 
+    def _session(self, read: bool = False):
+        """
+        打开会话
+        
+        读会话在集群（neo4j:// 协议）下路由到只读副本。
+        """
+        return self.driver.session(
+            database=self._database,
+            default_access_mode=READ_ACCESS if read else WRITE_ACCESS
+        )
+
+    async def _execute(self, work, read: bool = False):
+        """
+        在托管事务中执行 work(tx)（瞬时错误由驱动重试），并记录连接获取等待时间
+        
+        work 第一次被调用时连接已拿到；在此之前抛出的异常（如获取连接超时）计为获取失败。
+        """
+        started = time.monotonic()
+        acquired = False
+        
+        async def timed_work(tx):
+            nonlocal acquired
+            if not acquired:
+                acquired = True
+                self._record_acquire(time.monotonic() - started)
+            return await work(tx)
+        
+        self._pool_stats["in_flight"] += 1
+        try:
+            async with self._session(read=read) as session:
+                if read:
+                    return await session.execute_read(timed_work)
+                return await session.execute_write(timed_work)
+        except Exception:
+            if not acquired:
+                self._pool_stats["acquire_failures"] += 1
+            raise
+        finally:
+            self._pool_stats["in_flight"] -= 1
+
+    def _record_acquire(self, wait: float) -> None:
+        self._acquire_waits.append(wait)
+        self._pool_stats["acquired"] += 1
+        self._pool_stats["acquire_wait_total"] += wait
+        self._pool_stats["acquire_wait_max"] = max(self._pool_stats["acquire_wait_max"], wait)
+
+    async def _read(self, query: str, **params: Any) -> List:
+        """在托管读事务中执行查询，返回全部记录"""
+        async def work(tx):
+            result = await tx.run(query, **params)
+            return [record async for record in result]
+        
+        return await self._execute(work, read=True)
+
+    async def _write(self, query: str, **params: Any) -> Tuple[List, Any]:
+        """在托管写事务中执行语句，返回 (记录列表, 结果摘要)"""
+        async def work(tx):
+            result = await tx.run(query, **params)
+            records = [record async for record in result]
+            return records, await result.consume()
+        
+        return await self._execute(work)
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """返回连接池配置与连接获取等待指标"""
+        waits = sorted(self._acquire_waits)
+        acquired = self._pool_stats["acquired"]
+        return {
+            **self._pool_stats,
+            "max_pool_size": settings.NEO4J_MAX_POOL_SIZE,
+            "acquire_wait_avg": self._pool_stats["acquire_wait_total"] / acquired if acquired else 0.0,
+            "acquire_wait_p95": waits[min(int(len(waits) * 0.95), len(waits) - 1)] if waits else 0.0,
+            "driver_started": self._driver is not None,
+        }
+
+    async def ensure_schema(self, index_timeout: int = 300) -> int:
+        """
+        执行 schema 迁移并校验约束/索引（幂等，可在每次启动时调用）
+        
+        已执行的版本记录在 (:SchemaMigration {version}) 节点中；
+        无论是否有新迁移，都会校验所有约束与索引存在且已上线。
+        
+        Args:
+            index_timeout: 等待索引构建完成的最长时间（秒）
+            
+        Returns:
+            当前 schema 版本
+            
+        Raises:
+            RuntimeError: 约束或索引缺失、未能上线
+        """
+        async with self._session() as session:
+            result = await session.run("MATCH (m:SchemaMigration) RETURN m.version AS version")
+            applied = {record["version"] async for record in result}
+            
+            for version, description, statements in SCHEMA_MIGRATIONS:
+                if version in applied:
+                    continue
+                logger.info(f"Applying Neo4j schema migration v{version}: {description}")
+                for _, statement in statements:
+                    # schema 语句不能与数据写入放在同一事务中，逐条自动提交
+                    await (await session.run(statement)).consume()
+                await (await session.run(
+                    """
+                    MERGE (m:SchemaMigration {version: $version})
+                    SET m.description = $description, m.applied_at = $applied_at
+                    """,
+                    version=version, description=description,
+                    applied_at=datetime.utcnow().isoformat()
+                )).consume()
+            
+            # 校验：所有期望的约束与索引都存在，并等待索引上线
+            await (await session.run(
+                "CALL db.awaitIndexes($timeout)", timeout=index_timeout
+            )).consume()
+            result = await session.run("SHOW CONSTRAINTS YIELD name")
+            names = {record["name"] async for record in result}
+            result = await session.run("SHOW INDEXES YIELD name, state")
+            index_states = {record["name"]: record["state"] async for record in result}
+        
+        expected = _expected_schema_names()
+        missing = [name for name in expected if name not in names and name not in index_states]
+        offline = [
+            name for name in expected
+            if name in index_states and index_states[name] != "ONLINE"
+        ]
+        if missing or offline:
+            raise RuntimeError(f"Neo4j schema 校验失败: missing={missing}, offline={offline}")
+        
+        current_version = max(version for version, _, _ in SCHEMA_MIGRATIONS)
+        logger.info(f"Neo4j schema verified at v{current_version}")
+        return current_version
+
     async def close(self):
         """关闭连接"""
-        if self.driver:
-            await self.driver.close()
+        if self._driver is not None:
+            await self._driver.close()
+            self._driver = None
             logger.info("Neo4j driver closed.")
     
     # ==============================
@@ -54,15 +360,13 @@ class Neo4jClient:
     # ==============================
 
     async def create_node(self, label: str, properties: Dict) -> Optional[str]:
-        """创建节点（处理唯一性约束冲突）"""
+        """创建节点（处理唯一性约束冲突；返回内部 id，批量写入请使用 bulk_upsert_nodes）"""
         query = f"CREATE (n:{label} $properties) RETURN id(n) as node_id"
         try:
-            async with self.driver.session() as session:
-                result = await session.run(query, properties=properties)
-                record = await result.single()
-                node_id = str(record["node_id"])
-                logger.debug(f"Created node [{label}] with ID: {node_id}")
-                return node_id
+            records, _ = await self._write(query, properties=properties)
+            node_id = str(records[0]["node_id"])
+            logger.debug(f"Created node [{label}] with ID: {node_id}")
+            return node_id
         except ConstraintError as e:
             logger.warning(f"Constraint violated while creating node {label}: {e}")
             return None
@@ -73,30 +377,33 @@ class Neo4jClient:
     async def create_relationship(
         self, source_id: str, target_id: str, relation_type: str, properties: Optional[Dict] = None
     ) -> bool:
-        """创建关系"""
+        """创建关系（按内部 id 寻址，批量写入请使用 bulk_merge_relationships）"""
         query_base = f"MATCH (a), (b) WHERE id(a) = $source_id AND id(b) = $target_id"
         create_part = f"CREATE (a)-[r:{relation_type} $properties]->(b)" if properties else f"CREATE (a)-[r:{relation_type}]->(b)"
-        query = f"{query_base} {create_part}"
+        returns = "RETURN a.name AS source_name, b.name AS target_name, a:Concept AND b:Concept AS concepts"
+        query = f"{query_base} {create_part} {returns}"
 
         try:
-            async with self.driver.session() as session:
-                if not (source_id.isdigit() and target_id.isdigit()):
-                     logger.error(f"Invalid ID format: {source_id}, {target_id}")
-                     return False
-
-                result = await session.run(
-                    query,
-                    source_id=int(source_id),
-                    target_id=int(target_id),
-                    properties=properties or {}
-                )
-                summary = await result.consume()
-                if summary.counters.relationships_created > 0:
-                    logger.debug(f"Created relationship {relation_type} between {source_id} and {target_id}")
-                    return True
-                else:
-                    logger.warning(f"Failed to create relationship: Nodes {source_id} or {target_id} not found.")
-                    return False
+            if not (source_id.isdigit() and target_id.isdigit()):
+                logger.error(f"Invalid ID format: {source_id}, {target_id}")
+                return False
+
+            records, summary = await self._write(
+                query,
+                source_id=int(source_id),
+                target_id=int(target_id),
+                properties=properties or {}
+            )
+            if summary.counters.relationships_created > 0:
+                logger.debug(f"Created relationship {relation_type} between {source_id} and {target_id}")
+                self._notify_prerequisites(relation_type, [
+                    (record["source_name"], record["target_name"])
+                    for record in records if record["concepts"]
+                ])
+                return True
+            else:
+                logger.warning(f"Failed to create relationship: Nodes {source_id} or {target_id} not found.")
+                return False
         except Exception as e:
             logger.error(f"Error creating relationship: {e}")
             return False
@@ -105,70 +412,287 @@ class Neo4jClient:
         """根据名称获取节点"""
         query = f"MATCH (n:{label} {{name: $name}}) RETURN n, id(n) as node_id"
         try:
-            async with self.driver.session() as session:
-                result = await session.run(query, name=name)
-                record = await result.single()
-                if record:
-                    node = dict(record["n"])
-                    node["id"] = str(record["node_id"])
-                    return node
-                return None
+            records = await self._read(query, name=name)
+            if records:
+                node = dict(records[0]["n"])
+                node["id"] = str(records[0]["node_id"])
+                return node
+            return None
         except Exception as e:
             logger.error(f"Error in get_node_by_name: {e}")
             return None
 
     async def get_related_nodes(self, node_id: str, relation_type: Optional[str] = None) -> List[Dict]:
-        """获取相关节点"""
+        """获取相关节点（按内部 id 寻址，按业务主键批量查询请使用 get_related_nodes_bulk）"""
         try:
-            async with self.driver.session() as session:
-                if not node_id.isdigit():
-                    return []
+            if not node_id.isdigit():
+                return []
 
-                if relation_type:
-                    query = f"MATCH (a)-[r:{relation_type}]->(b) WHERE id(a) = $node_id RETURN b, id(b) as node_id, type(r) as relation"
-                else:
-                    query = "MATCH (a)-[r]->(b) WHERE id(a) = $node_id RETURN b, id(b) as node_id, type(r) as relation"
-                
-                result = await session.run(query, node_id=int(node_id))
-                records = await result.values()
-                
-                nodes = []
-                for record in records:
-                    node = dict(record[0])
-                    node["id"] = str(record[1])
-                    node["relation"] = record[2]
-                    nodes.append(node)
-                return nodes
+            if relation_type:
+                query = f"MATCH (a)-[r:{relation_type}]->(b) WHERE id(a) = $node_id RETURN b, id(b) as node_id, type(r) as relation"
+            else:
+                query = "MATCH (a)-[r]->(b) WHERE id(a) = $node_id RETURN b, id(b) as node_id, type(r) as relation"
+            
+            records = await self._read(query, node_id=int(node_id))
+            
+            nodes = []
+            for record in records:
+                node = dict(record[0])
+                node["id"] = str(record[1])
+                node["relation"] = record[2]
+                nodes.append(node)
+            return nodes
         except Exception as e:
             logger.error(f"Error getting related nodes for {node_id}: {e}")
             return []
 
+    # ==============================
+    # 批量图谱操作（按业务主键或 elementId 寻址）
+    # ==============================
+
+    async def bulk_upsert_nodes(
+        self, label: str, nodes: List[Dict], key: str = "id", chunk_size: int = 1000
+    ) -> List[Dict]:
+        """
+        批量创建或更新节点（UNWIND + MERGE，按 chunk_size 分事务写入）
+        
+        Args:
+            label: 节点标签
+            nodes: 节点属性字典列表，每个字典必须包含 key 属性
+            key: 业务主键属性名（建议为其建立唯一约束）
+            chunk_size: 每个事务写入的节点数
+            
+        Returns:
+            与输入一一对应的结果列表：
+            {"index", "key", "status": created/updated/error, "element_id", "error"}
+            同一分片内的重复主键合并为一行写入（属性按输入顺序合并，后者覆盖前者），
+            第一次出现按实际结果报告，之后的重复项报告为 updated
+            
+        Raises:
+            ValueError: 标签或主键名不合法
+        """
+        _check_identifier(label, "标签")
+        _check_identifier(key, "属性名")
+        outcomes: List[Dict] = [
+            {"index": i, "key": node.get(key), "status": "error", "element_id": None, "error": None}
+            for i, node in enumerate(nodes)
+        ]
+        rows = []
+        for i, node in enumerate(nodes):
+            if node.get(key) is None:
+                outcomes[i]["error"] = f"缺少主键属性 {key}"
+            else:
+                rows.append({"index": i, "key": node[key], "properties": node})
+        
+        query = f"""
+            UNWIND $rows AS row
+            OPTIONAL MATCH (existing:{label} {{{key}: row.key}})
+            WITH row, count(existing) > 0 AS existed
+            MERGE (n:{label} {{{key}: row.key}})
+            SET n += row.properties
+            RETURN row.index AS index, elementId(n) AS element_id, existed
+        """
+        for start, chunk in _chunks(rows, chunk_size):
+            # 同一次 UNWIND 中的重复主键看到的都是写入前的状态，会都被报告为 created，先在分片内合并
+            merged: Dict[Any, Dict] = {}
+            duplicates: Dict[int, List[int]] = {}
+            for row in chunk:
+                dedupe_key = tuple(row["key"]) if isinstance(row["key"], list) else row["key"]
+                first = merged.get(dedupe_key)
+                if first is None:
+                    merged[dedupe_key] = {**row, "properties": dict(row["properties"])}
+                else:
+                    first["properties"].update(row["properties"])
+                    duplicates.setdefault(first["index"], []).append(row["index"])
+            try:
+                records, _ = await self._write(query, rows=list(merged.values()))
+            except Exception as e:
+                logger.error(f"Bulk upsert of {label} nodes failed for rows {start}-{start + len(chunk) - 1}: {e}")
+                for row in chunk:
+                    outcomes[row["index"]]["error"] = str(e)
+                continue
+            for record in records:
+                outcome = outcomes[record["index"]]
+                outcome["status"] = "updated" if record["existed"] else "created"
+                outcome["element_id"] = record["element_id"]
+                for index in duplicates.get(record["index"], ()):
+                    outcomes[index]["status"] = "updated"
+                    outcomes[index]["element_id"] = record["element_id"]
+        return outcomes
+
+    async def bulk_merge_relationships(
+        self, relation_type: str, edges: List[Dict], label: Optional[str] = None,
+        key: Optional[str] = "id", chunk_size: int = 1000
+    ) -> List[Dict]:
+        """
+        批量创建关系（UNWIND + MERGE，已存在的关系只更新属性）
+        
+        Args:
+            relation_type: 关系类型
+            edges: [{"source", "target", "properties"(可选)}, ...]
+            label: 两端节点的标签（key 寻址时建议提供以使用索引）
+            key: 两端节点的业务主键属性名；为 None 时 source/target 按 elementId 寻址
+            chunk_size: 每个事务写入的关系数
+            
+        Returns:
+            与输入一一对应的结果列表：
+            {"index", "source", "target", "status": created/exists/missing_source/missing_target/error, "error"}
+            
+        Raises:
+            ValueError: 关系类型、标签或主键名不合法
+        """
+        _check_identifier(relation_type, "关系类型")
+        label_part = f":{_check_identifier(label, '标签')}" if label else ""
+        if key is None:
+            match = f"""
+            OPTIONAL MATCH (a{label_part}) WHERE elementId(a) = row.source
+            OPTIONAL MATCH (b{label_part}) WHERE elementId(b) = row.target
+            """
+        else:
+            _check_identifier(key, "属性名")
+            match = f"""
+            OPTIONAL MATCH (a{label_part} {{{key}: row.source}})
+            OPTIONAL MATCH (b{label_part} {{{key}: row.target}})
+            """
+        query = f"""
+            UNWIND $rows AS row
+            {match}
+            OPTIONAL MATCH (a)-[existing:{relation_type}]->(b)
+            WITH row, a, b, count(existing) > 0 AS existed
+            FOREACH (_ IN CASE WHEN a IS NOT NULL AND b IS NOT NULL THEN [1] ELSE [] END |
+                MERGE (a)-[r:{relation_type}]->(b)
+                SET r += row.properties
+            )
+            RETURN row.index AS index, a IS NOT NULL AS has_source, b IS NOT NULL AS has_target, existed,
+                   CASE WHEN a:Concept AND b:Concept THEN [a.name, b.name] END AS concept_edge
+        """
+        outcomes: List[Dict] = [
+            {"index": i, "source": edge.get("source"), "target": edge.get("target"),
+             "status": "error", "error": None}
+            for i, edge in enumerate(edges)
+        ]
+        rows = []
+        for i, edge in enumerate(edges):
+            if edge.get("source") is None or edge.get("target") is None:
+                outcomes[i]["error"] = "缺少 source 或 target"
+            else:
+                rows.append({
+                    "index": i, "source": edge["source"], "target": edge["target"],
+                    "properties": edge.get("properties") or {},
+                })
+        
+        for start, chunk in _chunks(rows, chunk_size):
+            try:
+                records, _ = await self._write(query, rows=chunk)
+            except Exception as e:
+                logger.error(f"Bulk merge of {relation_type} relationships failed for rows {start}-{start + len(chunk) - 1}: {e}")
+                for row in chunk:
+                    outcomes[row["index"]]["error"] = str(e)
+                continue
+            for record in records:
+                outcome = outcomes[record["index"]]
+                if not record["has_source"]:
+                    outcome["status"] = "missing_source"
+                elif not record["has_target"]:
+                    outcome["status"] = "missing_target"
+                else:
+                    outcome["status"] = "exists" if record["existed"] else "created"
+            self._notify_prerequisites(relation_type, [
+                tuple(record["concept_edge"]) for record in records
+                if record["concept_edge"] is not None and not record["existed"]
+            ])
+        return outcomes
+
+    async def get_related_nodes_bulk(
+        self, node_ids: List[str], relation_type: Optional[str] = None,
+        label: Optional[str] = None, key: Optional[str] = "id"
+    ) -> Dict[str, List[Dict]]:
+        """
+        批量获取多个节点的出边相邻节点
+        
+        Args:
+            node_ids: 节点业务主键列表（key 为 None 时为 elementId 列表）
+            relation_type: 只返回该类型的关系，None 表示全部
+            label: 起点节点标签
+            key: 起点节点的业务主键属性名；为 None 时按 elementId 寻址
+            
+        Returns:
+            {节点 ID: [相邻节点属性 + element_id + relation, ...]}，不存在的节点对应空列表
+        """
+        rel = f":{_check_identifier(relation_type, '关系类型')}" if relation_type else ""
+        label_part = f":{_check_identifier(label, '标签')}" if label else ""
+        if key is None:
+            match = f"MATCH (a{label_part}) WHERE elementId(a) = source_id"
+        else:
+            _check_identifier(key, "属性名")
+            match = f"MATCH (a{label_part} {{{key}: source_id}})"
+        records = await self._read(
+            f"""
+            UNWIND $node_ids AS source_id
+            {match}
+            MATCH (a)-[r{rel}]->(b)
+            RETURN source_id, b, elementId(b) AS element_id, type(r) AS relation
+            """,
+            node_ids=node_ids
+        )
+        related: Dict[str, List[Dict]] = {node_id: [] for node_id in node_ids}
+        for record in records:
+            node = dict(record["b"])
+            node["element_id"] = record["element_id"]
+            node["relation"] = record["relation"]
+            related[record["source_id"]].append(node)
+        return related
+
     # ==============================
     # DeepStudy 核心功能: 学习路径
     # ==============================
 
     async def get_learning_path(self, target_concept_name: str) -> List[str]:
-        """查找从基础到目标概念的学习路径"""
-        query = """
-        MATCH (target:Concept {name: $name})
-        MATCH path = (target)-[:REQUIRES|PART_OF*]->(root)
+        """
+        查找从基础到目标概念的学习路径（直接查询，不走缓存）
+        
+        返回找到的第一条路径，不保证最短（按长度排序需要枚举全部路径）；
+        在线请求应使用 LearningPathService，它缓存前置闭包并返回最短路径与备选路径。
+        """
+        # 变长路径的上界不能参数化，这里是受控的整数
+        query = f"""
+        MATCH (target:Concept {{name: $name}})
+        MATCH path = (target)-[:REQUIRES|PART_OF*1..{int(settings.LEARNING_PATH_MAX_DEPTH)}]->(root)
         WHERE NOT (root)-[:REQUIRES|PART_OF]->()
         RETURN reverse([node in nodes(path) | node.name]) AS steps
         LIMIT 1
         """
         try:
-            async with self.driver.session() as session:
-                result = await session.run(query, name=target_concept_name)
-                record = await result.single()
-                if record:
-                    path = record["steps"]
-                    logger.info(f"Found learning path for {target_concept_name}: {path}")
-                    return path
-                return []
+            records = await self._read(query, name=target_concept_name)
+            if records:
+                path = records[0]["steps"]
+                logger.info(f"Found learning path for {target_concept_name}: {path}")
+                return path
+            return []
         except Exception as e:
             logger.error(f"Error finding learning path: {e}")
             return []
 
+    async def get_prerequisite_graph(self) -> Dict[str, List[str]]:
+        """
+        读取全部 Concept 及其直接前置（REQUIRES/PART_OF 出边）
+        
+        供 LearningPathService 在内存中构建前置闭包，
+        没有前置的概念也会出现在结果中（值为空列表）。
+        
+        Returns:
+            {概念名: [直接前置概念名, ...]}
+        """
+        records = await self._read(
+            """
+            MATCH (c:Concept)
+            WHERE c.name IS NOT NULL
+            OPTIONAL MATCH (c)-[:REQUIRES|PART_OF]->(p:Concept)
+            RETURN c.name AS name, collect(DISTINCT p.name) AS prerequisites
+            """
+        )
+        return {record["name"]: record["prerequisites"] for record in records}
+
     # ==============================
     # 新增功能: 对话记忆 (Dialogue Memory)
     # ==============================
@@ -181,69 +705,296 @@ class Neo4jClient:
         if timestamp is None:
             timestamp = datetime.utcnow()
         
-        async with self.driver.session() as session:
-            await session.run(
-                """
-                MERGE (n:DialogueNode {node_id: $node_id})
-                SET n.user_id = $user_id,
-                    n.role = $role,
-                    n.content = $content,
-                    n.intent = $intent,
-                    n.mastery_score = $mastery_score,
-                    n.timestamp = $timestamp
-                """,
-                node_id=node_id, user_id=user_id, role=role, content=content,
-                intent=intent, mastery_score=mastery_score, timestamp=timestamp.isoformat()
-            )
+        await self._write(
+            """
+            MERGE (n:DialogueNode {node_id: $node_id})
+            SET n.user_id = $user_id,
+                n.role = $role,
+                n.content = $content,
+                n.intent = $intent,
+                n.mastery_score = $mastery_score,
+                n.timestamp = $timestamp
+            """,
+            node_id=node_id, user_id=user_id, role=role, content=content,
+            intent=intent, mastery_score=mastery_score, timestamp=timestamp.isoformat()
+        )
     
     async def link_dialogue_nodes(self, parent_node_id: str, child_node_id: str, fragment_id: Optional[str] = None) -> None:
         """创建对话节点之间的父子关系"""
-        async with self.driver.session() as session:
-            # 简单的存在性检查 query 可以合并优化，这里保留逻辑清晰
-            query = """
-                MATCH (parent:DialogueNode {node_id: $parent_node_id})
-                MATCH (child:DialogueNode {node_id: $child_node_id})
-                MERGE (parent)-[r:HAS_CHILD]->(child)
-                SET r.fragment_id = $fragment_id
-            """
-            await session.run(query, parent_node_id=parent_node_id, child_node_id=child_node_id, fragment_id=fragment_id)
+        # 简单的存在性检查 query 可以合并优化，这里保留逻辑清晰
+        query = """
+            MATCH (parent:DialogueNode {node_id: $parent_node_id})
+            MATCH (child:DialogueNode {node_id: $child_node_id})
+            MERGE (parent)-[r:HAS_CHILD]->(child)
+            SET r.fragment_id = $fragment_id
+        """
+        await self._write(query, parent_node_id=parent_node_id, child_node_id=child_node_id, fragment_id=fragment_id)
+
+    async def save_dialogue_turn(
+        self, user_node_id: str, ai_node_id: str, user_id: str, query: str, answer: str,
+        intent: Optional[str] = None, parent_id: Optional[str] = None,
+        fragment_id: Optional[str] = None, timestamp: Optional[datetime] = None
+    ) -> None:
+        """
+        保存一轮对话（单条语句、单个事务）
+        
+        写入用户节点、AI 节点、用户 -> AI 的 HAS_CHILD 关系，
+        以及可选的父节点 -> 用户节点关系，避免出现只写了一半的对话轮次。
+        """
+        await self.save_dialogue_turns([
+            self.dialogue_turn_row(
+                user_node_id=user_node_id, ai_node_id=ai_node_id, user_id=user_id,
+                query=query, answer=answer, intent=intent, parent_id=parent_id,
+                fragment_id=fragment_id, timestamp=timestamp
+            )
+        ])
+
+    @staticmethod
+    def dialogue_turn_row(
+        user_node_id: str, ai_node_id: str, user_id: str, query: str, answer: str,
+        intent: Optional[str] = None, parent_id: Optional[str] = None,
+        fragment_id: Optional[str] = None, timestamp: Optional[datetime] = None
+    ) -> Dict:
+        """构造 save_dialogue_turns 使用的一行参数"""
+        if timestamp is None:
+            timestamp = datetime.utcnow()
+        return {
+            "user_node_id": user_node_id, "ai_node_id": ai_node_id, "user_id": user_id,
+            "query": query, "answer": answer, "intent": intent, "parent_id": parent_id,
+            "fragment_id": fragment_id, "timestamp": timestamp.isoformat(),
+        }
+
+    async def save_dialogue_turns(self, rows: List[Dict], create_missing_parents: bool = False) -> None:
+        """
+        批量保存多轮对话（UNWIND，单个事务）
+        
+        Args:
+            rows: dialogue_turn_row 构造的参数列表
+            create_missing_parents: 父节点尚不存在时是否先创建只有 node_id 的占位节点
+                （绕过写后队列的同步写入使用：父节点可能仍在队列中，稍后的写入会补全其属性）
+        """
+        parent_part = """
+            WITH u, row
+            WHERE row.parent_id IS NOT NULL
+            MERGE (parent:DialogueNode {node_id: row.parent_id})
+            MERGE (parent)-[r:HAS_CHILD]->(u)
+            SET r.fragment_id = row.fragment_id
+        """ if create_missing_parents else """
+            WITH u, row
+            OPTIONAL MATCH (parent:DialogueNode {node_id: row.parent_id})
+            FOREACH (_ IN CASE WHEN parent IS NULL THEN [] ELSE [1] END |
+                MERGE (parent)-[r:HAS_CHILD]->(u)
+                SET r.fragment_id = row.fragment_id
+            )
+        """
+        query_text = """
+            UNWIND $rows AS row
+            MERGE (u:DialogueNode {node_id: row.user_node_id})
+            SET u.user_id = row.user_id,
+                u.role = 'user',
+                u.content = row.query,
+                u.intent = row.intent,
+                u.mastery_score = 0.0,
+                u.timestamp = row.timestamp
+            MERGE (a:DialogueNode {node_id: row.ai_node_id})
+            SET a.user_id = row.user_id,
+                a.role = 'assistant',
+                a.content = row.answer,
+                a.intent = row.intent,
+                a.mastery_score = 0.0,
+                a.timestamp = row.timestamp
+            MERGE (u)-[:HAS_CHILD]->(a)
+        """ + parent_part
+        await self._write(query_text, rows=rows)
 
     async def get_dialogue_node(self, node_id: str) -> Optional[Dict]:
         """获取单个对话节点"""
-        async with self.driver.session() as session:
-            result = await session.run("MATCH (n:DialogueNode {node_id: $node_id}) RETURN n", node_id=node_id)
-            record = await result.single()
-            return dict(record["n"]) if record else None
+        records = await self._read("MATCH (n:DialogueNode {node_id: $node_id}) RETURN n", node_id=node_id)
+        return dict(records[0]["n"]) if records else None
     
     async def get_dialogue_tree(self, root_node_id: str, user_id: str, max_depth: int = 10) -> Optional[Dict]:
-        """获取对话树（递归查询）"""
-        async with self.driver.session() as session:
-            root_result = await session.run(
-                "MATCH (n:DialogueNode {node_id: $node_id, user_id: $user_id}) RETURN n",
-                node_id=root_node_id, user_id=user_id
+        """
+        获取对话树
+        
+        一次变长遍历取回 max_depth 层内的全部节点和边，在 Python 中 O(n) 组装成树，
+        子节点按 timestamp 排序。
+        """
+        # 变长路径的上界不能参数化，这里是受控的整数
+        depth = max(int(max_depth), 0)
+        query = f"""
+            MATCH (root:DialogueNode {{node_id: $node_id, user_id: $user_id}})
+            OPTIONAL MATCH path = (root)-[:HAS_CHILD*1..{max(depth, 1)}]->(n:DialogueNode)
+            WITH root, n, last(relationships(path)) AS edge
+            RETURN root,
+                   collect(DISTINCT n) AS nodes,
+                   collect(DISTINCT [startNode(edge).node_id, n.node_id]) AS edges
+        """
+        records = await self._read(query, node_id=root_node_id, user_id=user_id)
+        if not records:
+            return None
+        record = records[0]
+        
+        root_node = dict(record["root"])
+        root_node["children"] = []
+        if depth == 0:
+            return root_node
+        
+        nodes_by_id = {root_node_id: root_node}
+        for node in record["nodes"]:
+            node_dict = dict(node)
+            if node_dict.get("node_id"):
+                node_dict["children"] = []
+                nodes_by_id[node_dict["node_id"]] = node_dict
+        
+        for parent_id, child_id in record["edges"]:
+            parent = nodes_by_id.get(parent_id)
+            child = nodes_by_id.get(child_id)
+            if parent is not None and child is not None:
+                parent["children"].append(child)
+        
+        for node in nodes_by_id.values():
+            if len(node["children"]) > 1:
+                node["children"].sort(key=lambda child: child.get("timestamp") or "")
+        return root_node
+
+    async def get_dialogue_tree_page(
+        self, root_node_id: str, user_id: str, depth: int = 2, page_size: int = 20,
+        preview_chars: int = 200
+    ) -> Optional[Dict]:
+        """
+        分页获取对话树（懒加载）
+        
+        只展开 depth 层，每个节点最多返回 page_size 个子节点，
+        其余子节点通过 next_cursor 调用 get_dialogue_children_page 继续加载。
+        第 depth 层的节点 child_count 可能大于 0 但 children 为空、next_cursor 为 None，
+        此时不带游标调用 get_dialogue_children_page 从第一页加载。
+        preview_chars > 0 时 content 只返回前若干字符。
+        所有层在同一个读事务中查询，结果是一致的快照。
+        """
+        async def work(tx):
+            result = await tx.run(
+                f"""
+                MATCH (n:DialogueNode {{node_id: $node_id, user_id: $user_id}})
+                RETURN n {_tree_node_projection("n")} AS node
+                """,
+                node_id=root_node_id, user_id=user_id, preview_chars=preview_chars
             )
-            root_record = await root_result.single()
-            if not root_record:
+            record = await result.single()
+            if not record:
                 return None
             
-            root_node = dict(root_record["n"])
-            # 内部递归函数
-            async def get_children(parent_id: str, depth: int) -> List[Dict]:
-                if depth >= max_depth: return []
-                result = await session.run(
-                    "MATCH (parent:DialogueNode {node_id: $parent_id})-[:HAS_CHILD]->(child:DialogueNode) RETURN child ORDER BY child.timestamp",
-                    parent_id=parent_id
-                )
-                children = []
-                async for record in result:
-                    child_node = dict(record["child"])
-                    if child_node.get("node_id"):
-                        child_node["children"] = await get_children(child_node["node_id"], depth + 1)
-                        children.append(child_node)
-                return children
+            root = self._tree_node(record["node"], preview_chars)
+            await self._expand_levels(
+                tx, [(root, None)], user_id, depth, page_size, preview_chars
+            )
+            return root
+        
+        return await self._execute(work, read=True)
+
+    async def get_dialogue_children_page(
+        self, parent_node_id: str, user_id: str, cursor: Optional[str] = None,
+        page_size: int = 20, depth: int = 1, preview_chars: int = 200
+    ) -> Optional[Dict]:
+        """
+        获取某节点的一页子节点（可继续向下展开 depth - 1 层）
+        
+        Returns:
+            {"parent_id", "children", "next_cursor"}；父节点不存在或不属于该用户时返回 None
+        
+        Raises:
+            ValueError: 游标格式不合法
+        """
+        after = _decode_cursor(cursor) if cursor else None
+        
+        async def work(tx):
+            result = await tx.run(
+                "MATCH (n:DialogueNode {node_id: $node_id, user_id: $user_id}) RETURN n.node_id AS node_id",
+                node_id=parent_node_id, user_id=user_id
+            )
+            if not await result.single():
+                return None
             
-            root_node["children"] = await get_children(root_node_id, 0)
-            return root_node
+            holder = {"node_id": parent_node_id, "children": [], "next_cursor": None}
+            await self._expand_levels(
+                tx, [(holder, after)], user_id, max(depth, 1), page_size, preview_chars
+            )
+            return {
+                "parent_id": parent_node_id,
+                "children": holder["children"],
+                "next_cursor": holder["next_cursor"],
+            }
+        
+        return await self._execute(work, read=True)
+
+    async def _expand_levels(
+        self, tx, frontier: List[Tuple[Dict, Optional[Tuple]]], user_id: str,
+        depth: int, page_size: int, preview_chars: int
+    ) -> None:
+        """逐层展开：每层一条查询，批量取回本层所有父节点的一页子节点"""
+        for _ in range(depth):
+            if not frontier:
+                return
+            parents = {node["node_id"]: node for node, _ in frontier}
+            rows = [
+                {
+                    "node_id": node["node_id"],
+                    "after_ts": after[0] if after else None,
+                    "after_id": after[1] if after else None,
+                }
+                for node, after in frontier
+            ]
+            result = await tx.run(
+                f"""
+                UNWIND $rows AS row
+                MATCH (p:DialogueNode {{node_id: row.node_id, user_id: $user_id}})
+                CALL {{
+                    WITH p, row
+                    MATCH (p)-[:HAS_CHILD]->(c:DialogueNode {{user_id: $user_id}})
+                    WHERE row.after_id IS NULL
+                       OR c.timestamp > row.after_ts
+                       OR (c.timestamp = row.after_ts AND c.node_id > row.after_id)
+                    RETURN c
+                    ORDER BY c.timestamp, c.node_id
+                    LIMIT $limit
+                }}
+                RETURN row.node_id AS parent_id, collect(c {_tree_node_projection("c")}) AS children
+                """,
+                rows=rows, user_id=user_id, limit=page_size + 1, preview_chars=preview_chars
+            )
+            frontier = []
+            async for record in result:
+                parent = parents[record["parent_id"]]
+                children = record["children"]
+                if len(children) > page_size:
+                    children = children[:page_size]
+                    last = children[-1]
+                    parent["next_cursor"] = _encode_cursor(last.get("timestamp"), last["node_id"])
+                for child in children:
+                    node = self._tree_node(child, preview_chars)
+                    parent["children"].append(node)
+                    if node["child_count"]:
+                        frontier.append((node, None))
+
+    @staticmethod
+    def _tree_node(projection: Dict, preview_chars: int) -> Dict:
+        """补全分页树节点的派生字段"""
+        node = dict(projection)
+        node["content_truncated"] = preview_chars > 0 and node["content_length"] > preview_chars
+        node["children"] = []
+        node["next_cursor"] = None
+        return node
+
+    async def get_dialogue_contents(self, node_ids: List[str], user_id: str) -> List[Dict]:
+        """批量获取节点完整内容（只返回属于该用户的节点）"""
+        records = await self._read(
+            """
+            MATCH (n:DialogueNode)
+            WHERE n.node_id IN $node_ids AND n.user_id = $user_id
+            RETURN n.node_id AS node_id, coalesce(n.content, '') AS content
+            """,
+            node_ids=node_ids, user_id=user_id
+        )
+        return [{"node_id": record["node_id"], "content": record["content"]} for record in records]
 
-# 全局客户端实例
+# 全局客户端实例（不创建驱动，驱动在应用 lifespan 中由 start() 创建）
 neo4j_client = Neo4jClient()
\ No newline at end of file
@@ -3,43 +3,191 @@ SQLite 数据库操作
 管理用户数据和对话记录
 """
 import aiosqlite
+import asyncio
 import json
 import os
+import sqlite3
+import time
 from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Optional, Dict, List
 from backend.config import settings
 
 
+class UserAlreadyExistsError(ValueError):
+    """用户名或邮箱违反唯一约束"""
+    
+    def __init__(self, field: str):
+        """
+        Args:
+            field: 冲突的字段（username 或 email）
+        """
+        self.field = field
+        super().__init__("用户名已存在" if field == "username" else "邮箱已被注册")
+
+
+def _unique_violation_field(error: sqlite3.IntegrityError) -> Optional[str]:
+    """从 UNIQUE 约束错误中解析冲突字段（消息形如 UNIQUE constraint failed: users.email）"""
+    message = str(error)
+    if "UNIQUE constraint failed" not in message:
+        return None
+    return "email" if "users.email" in message else "username"
+
+
+def _ensure_db_dir(db_path: str) -> None:
+    """确保数据目录存在"""
+    db_dir = os.path.dirname(db_path)
+    if db_dir and not os.path.exists(db_dir):
+        os.makedirs(db_dir, exist_ok=True)
+
+
+async def _connect(db_path: str) -> aiosqlite.Connection:
+    """打开连接并应用 pragma 配置"""
+    db = await aiosqlite.connect(db_path)
+    db.row_factory = aiosqlite.Row
+    # WAL：读写互不阻塞；synchronous=NORMAL 在 WAL 下只在检查点时 fsync
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    await db.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+    await db.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+    await db.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    await db.execute("PRAGMA temp_store=MEMORY")
+    return db
+
+
 async def get_db():
     """
-    获取数据库连接
+    获取一个独立的数据库连接（调用方负责关闭，用于初始化脚本等连接池之外的场景）
     
     Returns:
         数据库连接对象
     """
-    # 确保数据目录存在
     db_path = settings.SQLITE_DB_PATH
-    db_dir = os.path.dirname(db_path)
-    if db_dir and not os.path.exists(db_dir):
-        os.makedirs(db_dir, exist_ok=True)
+    _ensure_db_dir(db_path)
+    return await _connect(db_path)
+
+
+class SQLitePool:
+    """
+    SQLite 连接池
     
-    db = await aiosqlite.connect(db_path)
-    db.row_factory = aiosqlite.Row
-    return db
+    - 启动时创建 size 个只读连接和 1 个写连接，之后一直复用（每个 aiosqlite 连接对应一个后台线程）
+    - 写操作统一走写连接并串行执行（单写者），避免多个连接争抢写锁导致 SQLITE_BUSY
+    """
+    
+    def __init__(self, db_path: Optional[str] = None, size: Optional[int] = None):
+        """
+        初始化连接池（不打开连接）
+        
+        Args:
+            db_path: 数据库文件路径，默认取 SQLITE_DB_PATH
+            size: 只读连接数，默认取 SQLITE_POOL_SIZE
+        """
+        self.db_path = db_path or settings.SQLITE_DB_PATH
+        self.size = size or settings.SQLITE_POOL_SIZE
+        self._readers: Optional[asyncio.Queue] = None
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._stats = {
+            "reads": 0,
+            "writes": 0,
+            "read_wait_total": 0.0,
+            "read_wait_max": 0.0,
+            "write_wait_total": 0.0,
+            "write_wait_max": 0.0,
+        }
+    
+    @property
+    def is_open(self) -> bool:
+        return self._writer is not None
+    
+    async def open(self) -> None:
+        """创建全部连接（在应用 lifespan 中调用）"""
+        if self.is_open:
+            return
+        _ensure_db_dir(self.db_path)
+        self._writer = await _connect(self.db_path)
+        self._readers = asyncio.Queue()
+        for _ in range(self.size):
+            db = await _connect(self.db_path)
+            self._all_readers.append(db)
+            self._readers.put_nowait(db)
+    
+    async def close(self) -> None:
+        """关闭全部连接"""
+        for db in self._all_readers:
+            await db.close()
+        self._all_readers = []
+        self._readers = None
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+    
+    def _record_wait(self, kind: str, waited: float) -> None:
+        self._stats[f"{kind}s"] += 1
+        self._stats[f"{kind}_wait_total"] += waited
+        self._stats[f"{kind}_wait_max"] = max(self._stats[f"{kind}_wait_max"], waited)
+    
+    @asynccontextmanager
+    async def read(self):
+        """借出一个只读连接"""
+        started = time.monotonic()
+        db = await self._readers.get()
+        self._record_wait("read", time.monotonic() - started)
+        try:
+            yield db
+        finally:
+            if db.in_transaction:
+                await db.rollback()
+            self._readers.put_nowait(db)
+    
+    @asynccontextmanager
+    async def write(self):
+        """独占写连接，异常时回滚未提交的修改"""
+        started = time.monotonic()
+        async with self._write_lock:
+            self._record_wait("write", time.monotonic() - started)
+            try:
+                yield self._writer
+            finally:
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+    
+    def stats(self) -> Dict:
+        """返回连接等待指标"""
+        return {
+            **self._stats,
+            "pool_size": self.size,
+            "idle_readers": self._readers.qsize() if self._readers is not None else 0,
+            "read_wait_avg": self._stats["read_wait_total"] / self._stats["reads"] if self._stats["reads"] else 0.0,
+            "write_wait_avg": self._stats["write_wait_total"] / self._stats["writes"] if self._stats["writes"] else 0.0,
+        }
+
+
+# 全局连接池实例（在应用 lifespan 中 open）
+sqlite_pool = SQLitePool()
 
 
 @asynccontextmanager
-async def get_db_connection():
+async def get_db_connection(write: bool = False):
     """
     数据库连接上下文管理器
-    自动管理连接的打开和关闭
+    连接池已打开时从池中借出连接，否则打开一个临时连接并在结束时关闭
+    
+    Args:
+        write: 是否需要写入（写操作走单写者连接）
     
     Usage:
         async with get_db_connection() as db:
             # 使用 db 进行数据库操作
             user = await get_user_by_username(db, "username")
     """
+    if sqlite_pool.is_open:
+        async with (sqlite_pool.write() if write else sqlite_pool.read()) as db:
+            yield db
+        return
+    
     db = await get_db()
     try:
         yield db
@@ -83,16 +231,54 @@ async def create_user(
         
     Returns:
         用户 ID
+        
+    Raises:
+        UserAlreadyExistsError: 用户名或邮箱已存在（由 UNIQUE 约束检测，无需事先查询）
     """
     created_at = datetime.utcnow().isoformat()
-    cursor = await db.execute(
-        "INSERT INTO users (username, email, hashed_password, created_at) VALUES (?, ?, ?, ?)",
-        (username, email, hashed_password, created_at)
-    )
+    try:
+        cursor = await db.execute(
+            "INSERT INTO users (username, email, hashed_password, created_at) VALUES (?, ?, ?, ?)",
+            (username, email, hashed_password, created_at)
+        )
+    except sqlite3.IntegrityError as e:
+        field = _unique_violation_field(e)
+        if field is None:
+            raise
+        raise UserAlreadyExistsError(field) from e
     await db.commit()
     return cursor.lastrowid
 
 
+async def create_users(db: aiosqlite.Connection, users: List[Dict]) -> List[Dict]:
+    """
+    批量创建用户（单个事务，冲突的行跳过，不影响其他行）
+    
+    Args:
+        db: 数据库连接（应为写连接）
+        users: [{"username", "email", "hashed_password"}, ...]
+        
+    Returns:
+        与输入一一对应的结果：{"user_id", "error"}，成功时 error 为 None
+    """
+    created_at = datetime.utcnow().isoformat()
+    results = []
+    for user in users:
+        try:
+            # 单条语句失败只回滚该语句，事务内已插入的行保留
+            cursor = await db.execute(
+                "INSERT INTO users (username, email, hashed_password, created_at) VALUES (?, ?, ?, ?)",
+                (user["username"], user["email"], user["hashed_password"], created_at)
+            )
+            results.append({"user_id": cursor.lastrowid, "error": None})
+        except sqlite3.IntegrityError as e:
+            field = _unique_violation_field(e)
+            message = str(UserAlreadyExistsError(field)) if field else str(e)
+            results.append({"user_id": None, "error": message})
+    await db.commit()
+    return results
+
+
 async def get_user_by_username(
     db: aiosqlite.Connection,
     username: str
@@ -2,6 +2,7 @@
 向量存储管理
 使用 LlamaIndex 的向量存储功能
 """
+import asyncio
 from typing import List, Dict
 from llama_index.vector_stores import SimpleVectorStore
 from llama_index import VectorStoreIndex, ServiceContext
@@ -56,6 +57,20 @@ class VectorStoreManager:
         # TODO: 实现文档添加逻辑
         pass
     
+    async def embed(self, text: str) -> List[float]:
+        """
+        计算文本的查询向量
+        
+        嵌入模型在本地同步推理，放到线程中执行以免阻塞事件循环
+        
+        Args:
+            text: 待嵌入文本
+            
+        Returns:
+            嵌入向量
+        """
+        return await asyncio.to_thread(self.embed_model.get_query_embedding, text)
+    
     async def search(self, query: str, top_k: int = 5) -> List[Dict]:
         """
         搜索相似文档
@@ -2,13 +2,20 @@
 FastAPI 应用入口
 """
 import logging
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from backend.config import settings
 # from backend.api.routes import auth, chat, mindmap
-from backend.api.routes import auth, chat
-from backend.data.sqlite_db import init_db
-import asyncio
+from backend.api.routes import auth, chat, learning_path
+from backend.agent.orchestrator import AgentOrchestrator
+from backend.data.dialogue_writer import DialogueWriteBehindQueue
+from backend.data.learning_path import LearningPathService
+from backend.data.neo4j_client import neo4j_client
+from backend.data.sqlite_db import init_db, sqlite_pool
+from backend.api.password_hasher import password_hasher
+from backend.api.middleware.auth import get_admin_user_id, token_cache
+from backend.api.middleware.rate_limit import RateLimitMiddleware, rate_limiter_from_settings
 
 # 配置日志
 logging.basicConfig(
@@ -18,13 +25,85 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期管理
+    启动时初始化数据库并创建进程级共享的 Orchestrator，关闭时释放其资源
+    """
+    logger.info("应用启动，初始化数据库...")
+    await init_db()
+    await sqlite_pool.open()
+    logger.info("数据库初始化完成")
+
+    logger.info("连接 Neo4j 并预热连接池...")
+    try:
+        await neo4j_client.start()
+    except Exception as e:
+        # 降级：Neo4j 不可用时不阻断启动，首次查询时再尝试连接
+        logger.warning("Neo4j 连接失败（已降级处理）: %s", str(e), exc_info=True)
+
+    if settings.NEO4J_SCHEMA_BOOTSTRAP:
+        logger.info("执行 Neo4j schema 迁移...")
+        try:
+            await neo4j_client.ensure_schema()
+        except Exception as e:
+            # 降级：Neo4j 不可用时不阻断启动，查询退化为标签扫描
+            logger.warning("Neo4j schema 迁移失败（已降级处理）: %s", str(e), exc_info=True)
+
+    dialogue_writer = None
+    if settings.NEO4J_WRITE_BEHIND_ENABLED:
+        dialogue_writer = DialogueWriteBehindQueue(
+            neo4j_client,
+            max_queue=settings.NEO4J_WRITE_QUEUE_MAX,
+            batch_size=settings.NEO4J_WRITE_BATCH_SIZE,
+            flush_interval=settings.NEO4J_WRITE_FLUSH_INTERVAL,
+            enqueue_timeout=settings.NEO4J_WRITE_ENQUEUE_TIMEOUT,
+        )
+        dialogue_writer.start()
+
+    # 前置关系图在首次查询时加载
+    app.state.learning_paths = LearningPathService(
+        neo4j_client,
+        ttl_seconds=settings.LEARNING_PATH_GRAPH_TTL,
+        max_cached=settings.LEARNING_PATH_MAX_CACHED,
+        max_depth=settings.LEARNING_PATH_MAX_DEPTH,
+    )
+    # 本进程写入的前置关系增量失效闭包；其他进程（如导入脚本）的写入靠 TTL 重新加载
+    neo4j_client.add_prerequisite_listener(app.state.learning_paths.on_edges_changed)
+
+    logger.info("初始化 Orchestrator...")
+    app.state.orchestrator = AgentOrchestrator(dialogue_writer=dialogue_writer)
+    logger.info("Orchestrator 初始化成功")
+
+    try:
+        yield
+    finally:
+        logger.info("应用关闭，释放 Orchestrator 资源...")
+        await app.state.orchestrator.close()
+        logger.info("Orchestrator 已关闭")
+        if dialogue_writer is not None:
+            # 写完队列中剩余的对话
+            await dialogue_writer.stop()
+        neo4j_client.remove_prerequisite_listener(app.state.learning_paths.on_edges_changed)
+        await neo4j_client.close()
+        await sqlite_pool.close()
+        password_hasher.shutdown()
+
+
 # 创建 FastAPI 应用
 app = FastAPI(
     title="DeepStudy API",
     description="基于 ModelScope 的递归学习 Agent",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan,
 )
 
+# 配置限流（在 CORS 之前注册，使 429 响应也带上 CORS 头）
+rate_limiter = rate_limiter_from_settings() if settings.RATE_LIMIT_ENABLED else None
+if rate_limiter is not None:
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
 # 配置 CORS
 import json
 cors_origins = json.loads(settings.CORS_ORIGINS) if isinstance(settings.CORS_ORIGINS, str) else settings.CORS_ORIGINS
@@ -39,17 +118,10 @@ app.add_middleware(
 # 注册路由
 app.include_router(auth.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
+app.include_router(learning_path.router, prefix="/api")
 # app.include_router(mindmap.router)
 
 
-@app.on_event("startup")
-async def startup_event():
-    """应用启动时初始化数据库"""
-    logger.info("应用启动，初始化数据库...")
-    await init_db()
-    logger.info("数据库初始化完成")
-
-
 @app.get("/")
 async def root():
     """根路径"""
@@ -62,6 +134,20 @@ async def health():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics(user_id: str = Depends(get_admin_user_id)):
+    """运行指标（缓存命中率等），仅 ADMIN_USER_IDS 中的用户可访问"""
+    return {
+        **app.state.orchestrator.metrics(),
+        "learning_path": app.state.learning_paths.stats(),
+        "neo4j_pool": neo4j_client.pool_stats(),
+        "sqlite_pool": sqlite_pool.stats(),
+        "password_hasher": password_hasher.stats(),
+        "token_cache": token_cache.stats(),
+        "rate_limit": rate_limiter.stats() if rate_limiter is not None else None,
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(